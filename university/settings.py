@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -118,7 +119,7 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'university_app.pagination.HybridPagination',
     'PAGE_SIZE': 20,
 }
 
@@ -130,6 +131,35 @@ SPECTACULAR_SETTINGS = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Общий для всех процессов кэш (2-й уровень UniversityCache): Redis, если задан CACHE_REDIS_URL,
+# иначе файловый. 1-й уровень — LRU в памяти процесса на UNIVERSITY_CACHE_LOCAL_ENTRIES записей
+
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    }
+}
+
+UNIVERSITY_CACHE_LOCAL_ENTRIES = 128
+# Должно быть не меньше интервала задачи refresh-ahead-cache, иначе записи успеют устареть между запусками
+CACHE_REFRESH_AHEAD = 60 * 5
+CACHE_WARM_WORKERS = 4
+
+# Фоновые отчёты (jobs.py): результат хранится TTL секунд в MEDIA_ROOT/reports/jobs,
+# задача в очереди/работе дольше TIMEOUT считается зависшей
+REPORT_JOB_TTL = 60 * 60
+REPORT_JOB_TIMEOUT = 60 * 30
+REPORT_JOBS_DIR = os.path.join(MEDIA_ROOT, 'reports', 'jobs')
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -163,7 +193,31 @@ CELERY_APP = 'university'
 # Сохраняем результаты задач
 CELERY_RESULT_EXTENDED = True
 
+# Аудит: записи копятся до коммита транзакции и пишутся одним bulk_create.
+# True — сброс буфера уходит фоновой задачей Celery в очередь AUDIT_CELERY_QUEUE (None — очередь по умолчанию)
+AUDIT_ASYNC_FLUSH = False
+AUDIT_CELERY_QUEUE = None
+# Записи аудита старше N дней уезжают в сжатые сегменты MEDIA_ROOT/audit_archive
+AUDIT_RETENTION_DAYS = 180
+AUDIT_ARCHIVE_DIR = os.path.join(MEDIA_ROOT, 'audit_archive')
+
 # Периодические задачи
+CELERY_BEAT_SCHEDULE = {
+    'archive-audit-log': {
+        'task': 'university_app.tasks.archive_audit_log_task',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'purge-report-jobs': {
+        'task': 'university_app.tasks.purge_report_jobs_task',
+        'schedule': crontab(minute='*/15'),
+    },
+    # refresh-ahead: пересобираем наборы кэша, которым до soft TTL осталось меньше CACHE_REFRESH_AHEAD
+    'refresh-ahead-cache': {
+        'task': 'university_app.tasks.warm_cache_task',
+        'schedule': crontab(minute='*/5'),
+    },
+}
+
 INSTALLED_APPS += [
     'django_celery_beat',
     'django_celery_results',
@@ -9,6 +9,7 @@ from university_app.views import (
     report_students_above_average,
     report_teacher_schedule,
     report_course_average,
+    report_course_statistics,
     report_top_5_students,
     report_debtors
 )
@@ -27,6 +28,8 @@ router.register(r'enrollments', views.EnrollmentViewSet)
 router.register(r'schedules', views.ScheduleViewSet)
 router.register(r'exams', views.ExamViewSet)
 router.register(r'payments', views.PaymentViewSet)
+router.register(r'audit-log', views.AuditLogViewSet)
+router.register(r'report-jobs', views.ReportJobViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -45,6 +48,7 @@ urlpatterns = [
     path('api/reports/students-above-average/', report_students_above_average, name='students_above_average'),
     path('api/reports/teacher-schedule/<int:teacher_id>/', report_teacher_schedule, name='teacher_schedule'),
     path('api/reports/course-average/<int:course_id>/', report_course_average, name='course_average'),
+    path('api/reports/course-statistics/', report_course_statistics, name='course_statistics'),
     path('api/reports/top-5-students/', report_top_5_students, name='top_5_students'),
     path('api/reports/debtors/', report_debtors, name='debtors'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
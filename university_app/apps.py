@@ -7,3 +7,5 @@ class UniversityAppConfig(AppConfig):
 
     def ready(self):
         import university_app.signals
+        import university_app.cache
+        import university_app.stats
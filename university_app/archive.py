@@ -0,0 +1,120 @@
+# university_app/archive.py — архив журнала аудита: сжатые JSONL-сегменты в MEDIA_ROOT
+import gzip
+import json
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import AuditLog
+
+ARCHIVE_FIELDS = ['id', 'user_id', 'action', 'model_name', 'object_id', 'object_repr', 'changes', 'timestamp']
+
+
+class AuditArchive:
+    """
+    Перенос старых записей AuditLog в холодное хранилище:
+    - каждый сегмент — gzip JSONL + маленький манифест с диапазоном времени
+    - из горячей таблицы записи удаляются пачками после записи сегмента
+    - чтение окна времени открывает только сегменты, чьи диапазоны с ним пересекаются
+    """
+
+    SEGMENT_SIZE = 5000
+
+    @staticmethod
+    def get_archive_dir():
+        return getattr(settings, 'AUDIT_ARCHIVE_DIR', os.path.join(settings.MEDIA_ROOT, 'audit_archive'))
+
+    @staticmethod
+    def archive(older_than_days=None, segment_size=None):
+        """Архивирует записи старше N дней; возвращает список манифестов созданных сегментов"""
+        days = older_than_days if older_than_days is not None else settings.AUDIT_RETENTION_DAYS
+        segment_size = segment_size or AuditArchive.SEGMENT_SIZE
+        cutoff = timezone.now() - timedelta(days=days)
+        archive_dir = AuditArchive.get_archive_dir()
+        os.makedirs(archive_dir, exist_ok=True)
+
+        manifests = []
+        while True:
+            rows = list(
+                AuditLog.objects.filter(timestamp__lt=cutoff)
+                .order_by('timestamp', 'id')
+                .values(*ARCHIVE_FIELDS)[:segment_size]
+            )
+            if not rows:
+                break
+            manifest = AuditArchive._write_segment(archive_dir, rows)
+            try:
+                with transaction.atomic():
+                    AuditLog.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            except Exception:
+                # строки остались в горячей таблице — сегмент не нужен
+                AuditArchive._remove_segment(archive_dir, manifest)
+                raise
+            manifests.append(manifest)
+        return manifests
+
+    @staticmethod
+    def _write_segment(archive_dir, rows):
+        start, end = rows[0]['timestamp'], rows[-1]['timestamp']
+        name = f"audit_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}_{rows[0]['id']}"
+        with gzip.open(os.path.join(archive_dir, f"{name}.jsonl.gz"), 'wt', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}, ensure_ascii=False) + "\n")
+
+        manifest = {
+            'segment': f"{name}.jsonl.gz",
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'count': len(rows),
+            'first_id': rows[0]['id'],
+            'last_id': rows[-1]['id'],
+        }
+        # манифест пишется последним: сегмент без манифеста читатель просто не увидит
+        with open(os.path.join(archive_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        return manifest
+
+    @staticmethod
+    def _remove_segment(archive_dir, manifest):
+        name = manifest['segment'][:-len('.jsonl.gz')]
+        for filename in (f"{name}.json", manifest['segment']):
+            path = os.path.join(archive_dir, filename)
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def manifests():
+        archive_dir = AuditArchive.get_archive_dir()
+        if not os.path.isdir(archive_dir):
+            return []
+        result = []
+        for filename in sorted(os.listdir(archive_dir)):
+            if filename.endswith('.json'):
+                with open(os.path.join(archive_dir, filename), encoding='utf-8') as f:
+                    result.append(json.load(f))
+        return result
+
+    @staticmethod
+    def read(start=None, end=None):
+        """Записи архива за [start, end]; открываются только пересекающиеся сегменты"""
+        archive_dir = AuditArchive.get_archive_dir()
+        seen_ids = set()
+        for manifest in AuditArchive.manifests():
+            if end is not None and parse_datetime(manifest['start']) > end:
+                continue
+            if start is not None and parse_datetime(manifest['end']) < start:
+                continue
+            with gzip.open(os.path.join(archive_dir, manifest['segment']), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    timestamp = parse_datetime(row['timestamp'])
+                    if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                        continue
+                    # после сбоя между записью сегмента и удалением строки могли попасть в архив дважды
+                    if row['id'] in seen_ids:
+                        continue
+                    seen_ids.add(row['id'])
+                    row['timestamp'] = timestamp
+                    yield row
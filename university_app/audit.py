@@ -0,0 +1,144 @@
+# university_app/audit.py — буферизованная запись журнала аудита
+import logging
+import threading
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+# === РЕЕСТР АУДИРУЕМЫХ МОДЕЛЕЙ ===
+class AuditConfig:
+    """Что аудируем у модели: поля для diff и дешёвое представление объекта"""
+
+    def __init__(self, model, fields, repr_func):
+        self.model = model
+        self.fields = [model._meta.get_field(name) for name in fields]
+        self.repr_func = repr_func
+
+
+_registry = {}
+
+
+def register(model, fields=None, exclude=(), repr=None):
+    """
+    Подключение модели к аудиту (opt-in).
+    fields — поля для diff (по умолчанию все, кроме exclude и PK);
+    repr — функция instance → str, которая не должна делать запросов (по умолчанию str).
+    """
+    if fields is None:
+        fields = [f.name for f in model._meta.concrete_fields if not f.primary_key and f.name not in exclude]
+    _registry[model] = AuditConfig(model, fields, repr or str)
+
+
+def registered_models():
+    return list(_registry)
+
+
+def get_config(model):
+    return _registry.get(model)
+
+
+def related_repr(instance, name):
+    """str() связанного объекта, только если он уже загружен (select_related/присвоен); иначе «Модель #id»"""
+    field = instance._meta.get_field(name)
+    if field.is_cached(instance):
+        return str(getattr(instance, name))
+    return f"{field.related_model._meta.verbose_name} #{getattr(instance, field.attname)}"
+
+
+def object_repr(instance):
+    config = _registry.get(type(instance))
+    return (config.repr_func(instance) if config else str(instance))[:200]
+
+
+class AuditBuffer:
+    """
+    Записи аудита одной транзакции (одного уровня savepoint'ов).
+    Регистрируется в transaction.on_commit: на коммите сбрасывается одним bulk_create,
+    при откате Django выкидывает колбэк вместе с буфером.
+    """
+
+    def __init__(self, using):
+        self.using = using
+        self.entries = []
+        self.flushed = False
+
+    def __call__(self):
+        self.flushed = True
+        flush(self.entries, self.using)
+
+
+def _connection_buffers(connection, using):
+    """
+    Буферы соединения по savepoint'ам. Django заменяет список run_on_commit новым при коммите
+    и при любом откате (в т.ч. savepoint'а) — тогда забываем все буферы разом: выброшенные
+    пропали вместе с колбэками, уцелевшие сбросятся своими колбэками, а дальше заводятся новые.
+    Так не нужно искать свой колбэк в run_on_commit на каждой записи.
+    """
+    states = getattr(_local, 'buffers', None)
+    if states is None:
+        states = _local.buffers = {}
+    hooks, buffers = states.get(using, (None, None))
+    if hooks is not connection.run_on_commit:
+        buffers = {}
+        states[using] = (connection.run_on_commit, buffers)
+    return buffers
+
+
+def _current_buffer(using):
+    connection = transaction.get_connection(using)
+    buffers = _connection_buffers(connection, using)
+
+    # Свой буфер на каждый уровень savepoint'ов: откат вложенного atomic() отбрасывает только его записи.
+    # id savepoint'ов уникальны в пределах транзакции, уровень задаёт последний из них;
+    # atomic(savepoint=False) кладёт в savepoint_ids None — такие уровни откатываются только целиком
+    key = next((sid for sid in reversed(connection.savepoint_ids) if sid), None)
+    buffer = buffers.get(key)
+    if buffer is None or buffer.flushed:
+        buffer = buffers[key] = AuditBuffer(using)
+        transaction.on_commit(buffer, using=using, robust=True)
+    return buffer
+
+
+def record(entry, using=None):
+    record_many([entry], using)
+
+
+def record_many(entries, using=None):
+    """Вне транзакции пишем сразу, внутри — копим до коммита"""
+    using = using or DEFAULT_DB_ALIAS
+    if not entries:
+        return
+    if not transaction.get_connection(using).in_atomic_block:
+        flush(list(entries), using)
+        return
+    _current_buffer(using).entries.extend(entries)
+
+
+def serialize(entry):
+    return {
+        'user_id': entry.user_id,
+        'action': entry.action,
+        'model_name': entry.model_name,
+        'object_id': entry.object_id,
+        'object_repr': entry.object_repr,
+        'changes': entry.changes,
+    }
+
+
+def flush(entries, using=None):
+    if not entries:
+        return
+    if getattr(settings, 'AUDIT_ASYNC_FLUSH', False):
+        from .tasks import write_audit_entries
+        write_audit_entries.apply_async(
+            args=[[serialize(entry) for entry in entries]],
+            queue=getattr(settings, 'AUDIT_CELERY_QUEUE', None),
+        )
+        return
+    AuditLog.objects.using(using or DEFAULT_DB_ALIAS).bulk_create(entries)
+    logger.debug("Audit buffer flushed: %s entries", len(entries))
@@ -0,0 +1,200 @@
+# university_app/bulk.py — массовая запись на курсы и выставление оценок
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from . import audit
+from .cache import UniversityCache
+from .models import Course, Enrollment, Student, AuditLog, CourseGradeStats
+from .stats import UniversityStats
+
+MAX_ROWS = 1000
+
+
+class EnrollmentBulk:
+    """
+    Массовые операции над Enrollment одной транзакцией:
+    - create — записи [{student, course, grade?}] через bulk_create;
+    - update_grades — оценки [{id, grade}] через bulk_update.
+    Правило зачёта — Enrollment.update_passed(), как в save(). Сигналы bulk-операции не шлют,
+    поэтому аудит, сводку CourseGradeStats и версию кэша обновляем здесь же.
+    """
+
+    # === ПРОВЕРКИ ===
+    @staticmethod
+    def check_rows(rows):
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({'non_field_errors': ['Ожидается непустой массив']})
+        if len(rows) > MAX_ROWS:
+            raise ValidationError({'non_field_errors': [f'Не больше {MAX_ROWS} строк за запрос']})
+        if not all(isinstance(row, dict) for row in rows):
+            raise ValidationError({'non_field_errors': ['Каждая строка — объект']})
+
+    @staticmethod
+    def parse_int(row, name, errors, required=True, min_value=None, max_value=None):
+        value = row.get(name)
+        if value is None:
+            if required:
+                errors[name] = 'Обязательное поле'
+            return None
+        if isinstance(value, bool) or not str(value).isdigit():
+            errors[name] = 'Ожидается целое число'
+            return None
+        value = int(value)
+        if (min_value is not None and value < min_value) or (max_value is not None and value > max_value):
+            errors[name] = f'Допустимо от {min_value} до {max_value}'
+            return None
+        return value
+
+    @staticmethod
+    def check_courses(user, course_ids):
+        """Одна проверка прав на каждый затронутый курс (один запрос на все)"""
+        if user.role == 'admin':
+            return
+        if user.role != 'teacher' or not user.teacher_profile_id:
+            raise PermissionDenied("Доступ запрещён")
+        foreign = sorted(
+            Course.objects.filter(id__in=course_ids).exclude(teacher_id=user.teacher_profile_id)
+            .values_list('id', flat=True)
+        )
+        if foreign:
+            raise PermissionDenied(f"Нет прав на курсы: {', '.join(map(str, foreign))}")
+
+    @staticmethod
+    def check_existing(parsed, course_ids, errors):
+        """Существование и уникальность (student, course) — по запросу на все строки, а не на каждую"""
+        students = set(Student.objects.filter(id__in={s for _, s, _, _ in parsed}).values_list('id', flat=True))
+        courses = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+        existing = set(
+            Enrollment.objects.filter(student_id__in=students, course_id__in=courses)
+            .values_list('student_id', 'course_id')
+        )
+        seen = {}
+        for index, student_id, course_id, _ in parsed:
+            row_errors = {}
+            if student_id not in students:
+                row_errors['student'] = 'Студент не найден'
+            if course_id not in courses:
+                row_errors['course'] = 'Курс не найден'
+            pair = (student_id, course_id)
+            if pair in existing:
+                row_errors['non_field_errors'] = 'Студент уже записан на курс'
+            elif pair in seen:
+                row_errors['non_field_errors'] = f'Повтор строки {seen[pair]}'
+            seen.setdefault(pair, index)
+            if row_errors:
+                errors[index] = row_errors
+
+    @staticmethod
+    def raise_errors(errors):
+        if errors:
+            raise ValidationError({'errors': errors})
+
+    # === СОЗДАНИЕ ===
+    @staticmethod
+    def create(rows, user):
+        EnrollmentBulk.check_rows(rows)
+        errors, parsed = {}, []
+        for index, row in enumerate(rows):
+            row_errors = {}
+            student_id = EnrollmentBulk.parse_int(row, 'student', row_errors)
+            course_id = EnrollmentBulk.parse_int(row, 'course', row_errors)
+            grade = EnrollmentBulk.parse_int(row, 'grade', row_errors, required=False, min_value=0, max_value=100)
+            if row_errors:
+                errors[index] = row_errors
+            else:
+                parsed.append((index, student_id, course_id, grade))
+
+        course_ids = {course_id for _, _, course_id, _ in parsed}
+        EnrollmentBulk.check_courses(user, course_ids)
+
+        try:
+            # проверки и запись в одной транзакции, как в update_grades
+            with transaction.atomic():
+                EnrollmentBulk.check_existing(parsed, course_ids, errors)
+                EnrollmentBulk.raise_errors(errors)
+
+                enrollments = []
+                for _, student_id, course_id, grade in parsed:
+                    enrollment = Enrollment(student_id=student_id, course_id=course_id, grade=grade)
+                    enrollment.update_passed()
+                    enrollments.append(enrollment)
+                Enrollment.objects.bulk_create(enrollments, batch_size=500)
+                EnrollmentBulk.after_write(course_ids, user, created=enrollments)
+        except IntegrityError:
+            # запись на тот же курс успел сделать параллельный запрос (или студента/курс удалили)
+            raise ValidationError({'non_field_errors': ['Данные изменились во время записи, повторите запрос']})
+        return enrollments
+
+    # === ОЦЕНКИ ===
+    @staticmethod
+    def update_grades(rows, user, queryset):
+        """queryset — видимые пользователю записи (BaseViewSet.get_queryset)"""
+        EnrollmentBulk.check_rows(rows)
+        errors, grades = {}, {}
+        for index, row in enumerate(rows):
+            row_errors = {}
+            enrollment_id = EnrollmentBulk.parse_int(row, 'id', row_errors)
+            if 'grade' not in row:
+                row_errors['grade'] = 'Обязательное поле'
+            grade = EnrollmentBulk.parse_int(row, 'grade', row_errors, required=False, min_value=0, max_value=100)
+            if enrollment_id is not None and enrollment_id in grades:
+                row_errors['id'] = 'Повтор записи в запросе'
+            if row_errors:
+                errors[index] = row_errors
+            else:
+                grades[enrollment_id] = (index, grade)
+
+        with transaction.atomic():
+            enrollments = {
+                e.id: e for e in queryset.select_related(None).filter(id__in=grades).select_for_update().only('id', 'student_id', 'course_id', 'grade', 'passed')
+            }
+            for enrollment_id, (index, _) in grades.items():
+                if enrollment_id not in enrollments:
+                    errors[index] = {'id': 'Запись не найдена'}
+            EnrollmentBulk.raise_errors(errors)
+
+            course_ids = {e.course_id for e in enrollments.values()}
+            EnrollmentBulk.check_courses(user, course_ids)
+
+            updated = []
+            for enrollment_id, (_, grade) in grades.items():
+                enrollment = enrollments[enrollment_id]
+                old = {'grade': enrollment.grade, 'passed': enrollment.passed}
+                enrollment.grade = grade
+                enrollment.update_passed()
+                changes = EnrollmentBulk.diff(old, enrollment)
+                if changes:
+                    updated.append((enrollment, changes))
+
+            if updated:
+                Enrollment.objects.bulk_update([e for e, _ in updated], ['grade', 'passed'], batch_size=500)
+                EnrollmentBulk.after_write({e.course_id for e, _ in updated}, user, updated=updated)
+        return [e for e, _ in updated]
+
+    @staticmethod
+    def diff(old, enrollment):
+        """Формат AuditLog.changes как в signals.log_save"""
+        changes = {}
+        for name in ('grade', 'passed'):
+            old_val, new_val = old[name], getattr(enrollment, name)
+            if str(old_val) != str(new_val):
+                changes[Enrollment._meta.get_field(name).verbose_name] = {
+                    'old': str(old_val) if old_val is not None else None,
+                    'new': str(new_val) if new_val is not None else None,
+                }
+        return changes
+
+    # === ПОСЛЕ ЗАПИСИ ===
+    @staticmethod
+    def after_write(course_ids, user, created=(), updated=()):
+        model_name = Enrollment._meta.verbose_name
+        audit.record_many([
+            AuditLog(user=user, action='create', model_name=model_name, object_id=e.pk, object_repr=audit.object_repr(e))
+            for e in created
+        ] + [
+            AuditLog(user=user, action='update', model_name=model_name, object_id=e.pk,
+                     object_repr=audit.object_repr(e), changes=changes)
+            for e, changes in updated
+        ])
+        # сводка по затронутым курсам — одним GROUP BY, вместо дельты на каждую строку
+        UniversityStats.rebuild_rows(CourseGradeStats, sorted(course_ids))
+        UniversityCache.invalidate_model(Enrollment)
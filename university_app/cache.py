@@ -1,66 +1,481 @@
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from django.core.cache import cache
+from django.db import connections, transaction
 from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from .models import Course, Schedule, Payment
+from .models import Department, Teacher, Student, Course, Enrollment, Schedule, Exam, Payment
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
 
+def _new_version():
+    # Начальная версия — миллисекунды: после вытеснения счётчика из кэша версии не повторятся
+    return int(time.time() * 1000)
+
+
+class VersionBump:
+    """Колбэк on_commit: поднять версию таблицы. Один на модель за транзакцию"""
+
+    def __init__(self, model):
+        self.model = model
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        UniversityCache.bump_version(self.model)
+
+
+class LocalLRU:
+    """Ограниченный LRU-кэш в памяти процесса (1-й уровень перед общим кэшем)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CacheMetrics:
+    """
+    Счётчики попаданий/промахов/пересборок по семействам ключей (наборам данных).
+    Копятся в памяти процесса и раз в FLUSH_INTERVAL секунд сливаются в общий кэш,
+    чтобы статистика была общей для всех воркеров и не стоила запроса на каждое попадание.
+    """
+
+    COUNTERS = ('local_hits', 'shared_hits', 'misses', 'rebuilds', 'rebuild_ms')
+    FLUSH_INTERVAL = 10
+
+    _lock = threading.Lock()
+    _pending = defaultdict(int)
+    _last_flush = time.monotonic()
+
+    @staticmethod
+    def get_key(family, counter):
+        return f"cache_stats:{family}:{counter}"
+
+    @classmethod
+    def incr(cls, family, counter, value=1):
+        with cls._lock:
+            cls._pending[(family, counter)] += value
+            due = time.monotonic() - cls._last_flush >= cls.FLUSH_INTERVAL
+        if due:
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        with cls._lock:
+            pending, cls._pending = cls._pending, defaultdict(int)
+            cls._last_flush = time.monotonic()
+        for (family, counter), value in pending.items():
+            key = cls.get_key(family, counter)
+            if not cache.add(key, value, timeout=None):
+                try:
+                    cache.incr(key, value)
+                except ValueError:
+                    cache.set(key, value, timeout=None)
+
+    @classmethod
+    def snapshot(cls, families):
+        cls.flush()
+        keys = {cls.get_key(family, counter): (family, counter) for family in families for counter in cls.COUNTERS}
+        values = cache.get_many(list(keys))
+        stats = {family: dict.fromkeys(cls.COUNTERS, 0) for family in families}
+        for key, value in values.items():
+            family, counter = keys[key]
+            stats[family][counter] = value
+        return stats
+
+    @classmethod
+    def reset(cls, families):
+        with cls._lock:
+            cls._pending.clear()
+        cache.delete_many([cls.get_key(family, counter) for family in families for counter in cls.COUNTERS])
+
+
 class UniversityCache:
+    # Набор данных → таблицы, от которых он зависит.
+    # Изменение таблицы увеличивает её версию, версия входит в ключ — старые ключи просто перестают читаться
+    DATASETS = {
+        'courses': (Course, Teacher),
+        'schedule': (Schedule, Course, Teacher),
+        'debtors': (Payment, Student),
+        # Отчёты UniversityReports с аргументом (id преподавателя / курса)
+        'teacher_schedule': (Schedule, Course),
+        'course_stats': (Enrollment,),
+        # Области видимости для scoping.SCOPE_POLICIES (аргумент — id профиля)
+        'teacher_scope': (Course,),
+        'student_scope': (Enrollment,),
+    }
+    BASE_KEYS = {
+        'courses': "courses_with_teachers",
+        'schedule': "weekly_schedule",
+        'debtors': "debtors_report",
+        'teacher_schedule': "teacher_schedule",
+        'course_stats': "course_stats",
+        'teacher_scope': "teacher_scope",
+        'student_scope': "student_scope",
+    }
+    # soft TTL: после него значение ещё отдаётся, но в фоне пересобирается
+    TIMEOUTS = {
+        'courses': 60 * 15,
+        'schedule': 60 * 30,
+        'debtors': 60 * 10,
+        'teacher_schedule': 60 * 30,
+        'course_stats': 60 * 15,
+        'teacher_scope': 60 * 10,
+        'student_scope': 60 * 10,
+    }
+    # Наборы, для которых нельзя отдавать значение прошлой версии, пока идёт пересборка (права доступа):
+    # строятся сразу, без ожидания владельца блокировки
+    STRICT = {'teacher_scope', 'student_scope'}
+    # Все таблицы с версиями: наборы данных выше + ETag'и вьюсетов и отчётов (conditional.py)
+    TRACKED_MODELS = (Department, Teacher, Student, Course, Enrollment, Schedule, Exam, Payment)
+    # Прогреваемые наборы → функция, возвращающая список аргументов (None — набор без аргументов).
+    # Области видимости сюда не входят: они строятся лениво, на первый запрос пользователя
+    WARMUP = {
+        'courses': None,
+        'schedule': None,
+        'debtors': None,
+        'teacher_schedule': lambda: Teacher.objects.order_by('id').values_list('id', flat=True),
+        'course_stats': lambda: Course.objects.order_by('id').values_list('id', flat=True),
+    }
+    WARM_WORKERS = getattr(settings, 'CACHE_WARM_WORKERS', 4)
+    # hard TTL = soft TTL + STALE_GRACE
+    STALE_GRACE = 60 * 10
+    LOCK_TIMEOUT = 60
+    LOCK_WAIT = 5
+
+    local = LocalLRU(getattr(settings, 'UNIVERSITY_CACHE_LOCAL_ENTRIES', 128))
+    # Подъёмы версий, запланированные в текущей транзакции (соединения у потоков свои)
+    local_bumps = threading.local()
+
+    @staticmethod
+    def get_version_key(model):
+        return f"table_version:{model._meta.label_lower}"
+
+    @staticmethod
+    def get_versions(models):
+        keys = [UniversityCache.get_version_key(model) for model in models]
+        versions = cache.get_many(keys)
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            for key in missing:
+                # add, а не set: если другой процесс успел первым — берём его значение
+                cache.add(key, _new_version(), timeout=None)
+            versions.update(cache.get_many(missing))
+        return [versions[key] for key in keys]
+
+    @staticmethod
+    def bump_version(model):
+        key = UniversityCache.get_version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), timeout=None)
+
+    @staticmethod
+    def invalidate_model(model):
+        """Сброс всех наборов, зависящих от таблицы модели — после коммита, чтобы не закэшировать незакоммиченное"""
+        connection = transaction.get_connection()
+        # запланированные подъёмы версий живут, пока Django не заменил список run_on_commit
+        # (коммит или откат, в т.ч. savepoint'а) — без поиска по run_on_commit на каждое сохранение
+        hooks, scheduled = getattr(UniversityCache.local_bumps, 'state', (None, None))
+        if hooks is not connection.run_on_commit:
+            scheduled = {}
+            UniversityCache.local_bumps.state = (connection.run_on_commit, scheduled)
+        bump = scheduled.get(model)
+        if bump is not None and not bump.done:
+            return  # уже запланировано в этой транзакции
+        bump = scheduled[model] = VersionBump(model)
+        transaction.on_commit(bump)
+
+    @staticmethod
+    def get_dataset_key(name, *args):
+        versions = UniversityCache.get_versions(UniversityCache.DATASETS[name])
+        suffix = ''.join(f":{arg}" for arg in args)
+        return f"{UniversityCache.BASE_KEYS[name]}{suffix}:v{'.'.join(map(str, versions))}"
+
+    @staticmethod
+    def get_last_key(name, *args):
+        """Последнее построенное значение без версии — его отдают, пока кто-то другой пересобирает набор"""
+        suffix = ''.join(f":{arg}" for arg in args)
+        return f"{UniversityCache.BASE_KEYS[name]}{suffix}:last"
+
     @staticmethod
     def get_courses_key():
-        return "courses_with_teachers"
+        return UniversityCache.get_dataset_key('courses')
 
     @staticmethod
     def get_schedule_key():
-        return "weekly_schedule"
+        return UniversityCache.get_dataset_key('schedule')
 
     @staticmethod
     def get_debtors_key():
-        return "debtors_report"
+        return UniversityCache.get_dataset_key('debtors')
 
     @staticmethod
     def invalidate_all():
-        keys = [
-            UniversityCache.get_courses_key(),
-            UniversityCache.get_schedule_key(),
-            UniversityCache.get_debtors_key(),
-        ]
-        cache.delete_many(keys)
+        for model in UniversityCache.TRACKED_MODELS:
+            UniversityCache.bump_version(model)
         logger.info("University cache invalidated")
 
+    # === SINGLE-FLIGHT + STALE-WHILE-REVALIDATE ===
     @staticmethod
-    def get_courses():
-        key = UniversityCache.get_courses_key()
-        data = cache.get(key)
-        if data is None:
-            data = list(Course.objects.select_related('teacher').values(
-                'id', 'name', 'description', 'credits',
-                'teacher__full_name', 'teacher__position'
-            ))
-            cache.set(key, data, timeout=60 * 15)
+    def get_or_build(name, *args, strict=False):
+        """
+        Значение набора данных:
+        - свежее (до soft TTL) — отдаём как есть;
+        - устаревшее (после soft TTL, до hard) — отдаём и один вызывающий ставит фоновое обновление;
+        - холодное — пересобирает один владелец блокировки, остальные получают последнее значение.
+        strict=True — значение прошлой версии (:last) не отдаём, ждём владельца блокировки:
+        ответ под ETag текущих версий таблиц должен быть собран на этих версиях.
+        """
+        key = UniversityCache.get_dataset_key(name, *args)
+
+        # 1-й уровень — LRU в памяти процесса. Ключ содержит версии таблиц,
+        # прочитанные из общего кэша, поэтому устаревшая локальная запись просто не найдётся
+        entry = UniversityCache.local.get(key)
+        if entry is not None and entry['fresh_until'] > time.time():
+            CacheMetrics.incr(name, 'local_hits')
+            return entry['data']
+
+        # 2-й уровень — общий кэш
+        entry = cache.get(key)
+        if entry is not None:
+            CacheMetrics.incr(name, 'shared_hits')
+            UniversityCache.local.set(key, entry, entry['expires_at'])
+            if entry['fresh_until'] <= time.time() and cache.add(f"lock:{key}", 1, UniversityCache.LOCK_TIMEOUT):
+                UniversityCache.schedule_refresh(name, *args, lock_key=f"lock:{key}")
+            return entry['data']
+
+        CacheMetrics.incr(name, 'misses')
+        lock_key = f"lock:{key}"
+        if cache.add(lock_key, 1, UniversityCache.LOCK_TIMEOUT):
+            try:
+                return UniversityCache.rebuild(name, *args)
+            finally:
+                cache.delete(lock_key)
+
+        if name in UniversityCache.STRICT:
+            return UniversityCache.get_builder(name)(*args)
+
+        last = None if strict else cache.get(UniversityCache.get_last_key(name, *args))
+        if last is not None:
+            return last['data']
+
+        # Отдать нечего — ждём владельца блокировки, а не дождавшись, строим сами
+        deadline = time.time() + UniversityCache.LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['data']
+        return UniversityCache.get_builder(name)(*args)
+
+    @staticmethod
+    def rebuild(name, *args):
+        # Ключ берём до построения: если таблица изменится во время сборки, результат ляжет под старую версию
+        key = UniversityCache.get_dataset_key(name, *args)
+        soft_ttl = UniversityCache.TIMEOUTS[name]
+        hard_ttl = soft_ttl + UniversityCache.STALE_GRACE
+
+        started = time.monotonic()
+        data = UniversityCache.get_builder(name)(*args)
+        CacheMetrics.incr(name, 'rebuilds')
+        CacheMetrics.incr(name, 'rebuild_ms', int((time.monotonic() - started) * 1000))
+
+        now = time.time()
+        entry = {'data': data, 'fresh_until': now + soft_ttl, 'expires_at': now + hard_ttl}
+        cache.set_many({key: entry, UniversityCache.get_last_key(name, *args): entry}, timeout=hard_ttl)
+        UniversityCache.local.set(key, entry, entry['expires_at'])
         return data
 
+    @staticmethod
+    def schedule_refresh(name, *args, lock_key=None):
+        from .tasks import refresh_cache_dataset
+        try:
+            refresh_cache_dataset.apply_async(args=[name, *args], kwargs={'lock_key': lock_key}, retry=False)
+        except Exception:
+            # брокер недоступен — отдаём устаревшее, обновит следующий запрос
+            logger.exception("Cache refresh for %s not scheduled", name)
+            if lock_key:
+                cache.delete(lock_key)
+
+    # === ПРОГРЕВ ===
+    @staticmethod
+    def get_warm_targets(names=None):
+        """[(набор, args), ...] для прогрева"""
+        targets = []
+        for name, args_source in UniversityCache.WARMUP.items():
+            if names and name not in names:
+                continue
+            if args_source is None:
+                targets.append((name, ()))
+            else:
+                targets.extend((name, (arg,)) for arg in args_source())
+        return targets
+
+    @staticmethod
+    def warm_one(name, *args, ahead=None):
+        """
+        Пересборка одного значения; ahead — секунды до soft TTL: свежие записи, которым
+        до устаревания больше ahead, пропускаются. Возвращает True, если значение пересобрано.
+        """
+        key = UniversityCache.get_dataset_key(name, *args)
+        if ahead is not None:
+            entry = cache.get(key)
+            if entry is not None and entry['fresh_until'] - time.time() > ahead:
+                return False
+        # та же блокировка, что у single-flight: не пересобираем то, что уже пересобирает запрос
+        lock_key = f"lock:{key}"
+        if not cache.add(lock_key, 1, UniversityCache.LOCK_TIMEOUT):
+            return False
+        try:
+            UniversityCache.rebuild(name, *args)
+        finally:
+            cache.delete(lock_key)
+        return True
+
+    @staticmethod
+    def _warm_worker(name, args, ahead):
+        started = time.monotonic()
+        try:
+            return UniversityCache.warm_one(name, *args, ahead=ahead), time.monotonic() - started
+        finally:
+            # поток пула открывает своё соединение с БД — закрываем, иначе оно повиснет до конца процесса
+            connections.close_all()
+
+    @staticmethod
+    def warm(names=None, workers=None, ahead=None):
+        """
+        Прогрев наборов из WARMUP в пуле потоков (workers=1 — последовательно в текущем потоке).
+        Возвращает {набор: {'entries', 'rebuilt', 'seconds'}}, seconds — суммарное время сборки.
+        """
+        workers = workers or UniversityCache.WARM_WORKERS
+        targets = UniversityCache.get_warm_targets(names)
+        stats = {name: {'entries': 0, 'rebuilt': 0, 'seconds': 0.0} for name, _ in targets}
+
+        if workers <= 1:
+            results = []
+            for name, args in targets:
+                started = time.monotonic()
+                results.append((UniversityCache.warm_one(name, *args, ahead=ahead), time.monotonic() - started))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(lambda target: UniversityCache._warm_worker(*target, ahead), targets))
+
+        for (name, _), (rebuilt, seconds) in zip(targets, results):
+            stats[name]['entries'] += 1
+            stats[name]['rebuilt'] += int(rebuilt)
+            stats[name]['seconds'] += seconds
+        return stats
+
+    @staticmethod
+    def get_builder(name):
+        return getattr(UniversityCache, f"build_{name}")
+
+    @staticmethod
+    def build_courses():
+        return list(Course.objects.select_related('teacher').values(
+            'id', 'name', 'description', 'credits',
+            'teacher__full_name', 'teacher__position'
+        ))
+
+    @staticmethod
+    def build_schedule():
+        return list(Schedule.objects.select_related('course', 'teacher').values(
+            'course__name', 'teacher__full_name', 'room',
+            'day_of_week', 'start_time', 'end_time'
+        ))
+
+    @staticmethod
+    def build_debtors():
+        from .reports import UniversityReports
+        return UniversityReports.debtors_with_debt_amount()
+
+    @staticmethod
+    def build_teacher_schedule(teacher_id):
+        from .reports import UniversityReports
+        return UniversityReports.teacher_week_schedule(teacher_id)
+
+    @staticmethod
+    def build_course_stats(course_id):
+        from .reports import UniversityReports
+        return UniversityReports.course_average_grade(course_id)
+
+    @staticmethod
+    def build_teacher_scope(teacher_id):
+        return {'course_ids': list(Course.objects.filter(teacher_id=teacher_id).order_by('id').values_list('id', flat=True))}
+
+    @staticmethod
+    def build_student_scope(student_id):
+        return {'course_ids': list(Enrollment.objects.filter(student_id=student_id).order_by('course_id').values_list('course_id', flat=True))}
+
+    @staticmethod
+    def get_courses():
+        return UniversityCache.get_or_build('courses')
+
     @staticmethod
     def get_schedule():
-        key = UniversityCache.get_schedule_key()
-        data = cache.get(key)
-        if data is None:
-            from .models import Schedule
-            data = list(Schedule.objects.select_related('course', 'teacher').values(
-                'course__name', 'teacher__full_name', 'room',
-                'day_of_week', 'start_time', 'end_time'
-            ))
-            cache.set(key, data, timeout=60 * 30)
-        return data
+        return UniversityCache.get_or_build('schedule')
 
     @staticmethod
     def get_debtors():
-        key = UniversityCache.get_debtors_key()
-        data = cache.get(key)
-        if data is None:
-            from .reports import UniversityReports
-            data = UniversityReports.debtors_with_debt_amount()
-            cache.set(key, data, timeout=60 * 10)
-        return data
+        return UniversityCache.get_or_build('debtors')
+
+    @staticmethod
+    def get_teacher_schedule(teacher_id, strict=False):
+        return UniversityCache.get_or_build('teacher_schedule', teacher_id, strict=strict)
+
+    @staticmethod
+    def get_course_stats(course_id, strict=False):
+        return UniversityCache.get_or_build('course_stats', course_id, strict=strict)
+
+    @staticmethod
+    def get_teacher_scope(teacher_id):
+        """{'course_ids': курсы преподавателя}"""
+        return UniversityCache.get_or_build('teacher_scope', teacher_id)
+
+    @staticmethod
+    def get_student_scope(student_id):
+        """{'course_ids': курсы, на которые записан студент}"""
+        return UniversityCache.get_or_build('student_scope', student_id)
+
+
+# === ИНВАЛИДАЦИЯ ПО СИГНАЛАМ ===
+def invalidate_on_change(sender, **kwargs):
+    UniversityCache.invalidate_model(sender)
+
+
+for _model in UniversityCache.TRACKED_MODELS:
+    post_save.connect(invalidate_on_change, sender=_model, dispatch_uid=f'cache_save_{_model._meta.label}')
+    post_delete.connect(invalidate_on_change, sender=_model, dispatch_uid=f'cache_delete_{_model._meta.label}')
@@ -0,0 +1,77 @@
+# university_app/conditional.py — условные GET (ETag / If-None-Match) поверх версий таблиц UniversityCache
+import hashlib
+from functools import wraps
+from rest_framework import status
+from rest_framework.response import Response
+from .cache import UniversityCache
+from .scoping import SCOPE_MODELS
+
+
+def compute_etag(request, models):
+    """
+    ETag = хэш версий таблиц + пользователь и его профиль + путь с query string + Accept.
+    Версии читаются из кэша одним get_many — ни одного запроса к БД.
+    """
+    user = request.user
+    models = list(dict.fromkeys([*models, *SCOPE_MODELS.get(getattr(user, 'role', None), ())]))
+    versions = UniversityCache.get_versions(models)
+    parts = [
+        *(f"{model._meta.label_lower}={version}" for model, version in zip(models, versions)),
+        f"user={user.pk}:{user.role}:{user.teacher_profile_id}:{user.student_profile_id}",
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+    ]
+    return '"%s"' % hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # слабые валидаторы сравниваем без префикса W/
+    return etag in [tag.strip().removeprefix('W/') for tag in header.split(',')]
+
+
+def conditional_response(request, models, build_response):
+    """304, если клиентская копия актуальна; иначе ответ build_response() с ETag (только для 200)"""
+    etag = compute_etag(request, models)
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build_response()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+    response['ETag'] = etag
+    # копия только для этого пользователя и всегда с перепроверкой — 304 дешевле повторной выгрузки
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag для list/retrieve вьюсета. Таблицы — etag_models (по умолчанию модель queryset'а);
+    проверка идёт после аутентификации и прав, но до get_queryset().
+    """
+
+    etag_models = None
+
+    def get_etag_models(self):
+        return self.etag_models or (self.queryset.model,)
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(request, self.get_etag_models(), lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(request, self.get_etag_models(), lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+
+def etag_report(*models):
+    """Декоратор отчёта (под @api_view): 304 до построения отчёта, если таблицы models не менялись"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return conditional_response(request, models, lambda: view(request, *args, **kwargs))
+        return wrapper
+    return decorator
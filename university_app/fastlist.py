@@ -0,0 +1,97 @@
+# university_app/fastlist.py — быстрый list: строки из .values() вместо ModelSerializer
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from .sparse import resolve_source
+
+# Поля, чей to_representation для значения из .values() ничего не меняет (int → int, str → str, bool → bool)
+IDENTITY_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField, PrimaryKeyRelatedField,
+)
+
+
+class FieldPlan:
+    """Одно выходное поле: откуда взять значение в строке .values() и как его отрисовать"""
+
+    __slots__ = ('name', 'path', 'relations', 'convert', 'skip_missing')
+
+    def __init__(self, name, path, relations, field):
+        self.name = name
+        self.path = path
+        self.relations = relations
+        # как Serializer.to_representation: None не проходит через to_representation
+        self.convert = None if isinstance(field, IDENTITY_FIELDS) and not isinstance(field, serializers.ChoiceField) \
+            else field.to_representation
+        # связь по пути пуста: Field.get_attribute ловит AttributeError → default / None / пропуск поля
+        self.skip_missing = not field.allow_null and not field.required
+
+
+class ListPlan:
+    """Скомпилированное отображение полей сериализатора на .values()"""
+
+    def __init__(self, fields, extra_paths=()):
+        self.fields = fields
+        paths = [plan.path for plan in fields]
+        paths += [relation for plan in fields for relation in plan.relations]
+        self.paths = list(dict.fromkeys([*paths, *extra_paths]))
+
+    def render(self, rows):
+        fields = self.fields
+        result = []
+        for row in rows:
+            item = {}
+            for plan in fields:
+                if plan.relations and any(row[relation] is None for relation in plan.relations):
+                    if plan.skip_missing:
+                        continue
+                    item[plan.name] = None
+                    continue
+                value = row[plan.path]
+                item[plan.name] = value if value is None or plan.convert is None else plan.convert(value)
+            result.append(item)
+        return result
+
+
+def compile_plan(serializer, model, extra_paths=()):
+    """ListPlan для сериализатора (с учётом урезанных ?fields=) или None, если быстрый путь невозможен"""
+    plans = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if getattr(field, 'default', serializers.empty) is not serializers.empty \
+                or isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer)):
+            return None
+        resolved = resolve_source(model, field)
+        if resolved is None:
+            return None
+        plans.append(FieldPlan(name, resolved[0], resolved[1], field))
+    return ListPlan(plans, extra_paths)
+
+
+class FastListMixin:
+    """
+    list() через .values() и ListPlan: без модельных инстансов и обхода полей сериализатора.
+    Вывод байт-в-байт как у сериализатора; если поле не сводится к колонкам — обычный путь.
+    fast_list = False у вьюсета отключает быстрый путь (см. команду benchmark_lists).
+    """
+
+    fast_list = True
+
+    def get_list_plan(self):
+        if not self.fast_list:
+            return None
+        model = self.queryset.model
+        # ключи пагинации должны быть в строке .values() (KeysetPagination берёт их из dict)
+        ordering = [name.lstrip('-') for name in getattr(self, 'keyset_ordering', ())]
+        return compile_plan(self.get_serializer(), model, [model._meta.pk.name, *ordering])
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_list_plan()
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = self.filter_queryset(self.get_queryset()).values(*plan.paths)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(rows))
@@ -0,0 +1,358 @@
+# university_app/importers.py — пакетный импорт студентов из CSV/XLSX
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from django.db import transaction
+from django.db.models.functions import Lower
+from .models import Student, AuditLog
+from . import audit
+from .cache import UniversityCache
+
+STATUS_VALUES = [value for value, _ in Student.STATUS_CHOICES]
+# 'active' → 'active', 'обучается' → 'active' и т.д.
+STATUS_LOOKUP = {
+    **{label.lower(): value for value, label in Student.STATUS_CHOICES},
+    **{value: value for value in STATUS_VALUES},
+}
+GPA_QUANTUM = Decimal('0.01')
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+# Длины колонок — из модели: SQLite их не проверяет, а PostgreSQL отклонит всю пачку
+EMAIL_MAX_LENGTH = Student._meta.get_field('email').max_length
+FULL_NAME_MAX_LENGTH = Student._meta.get_field('full_name').max_length
+
+
+class ImportResult:
+    """Итог импорта: создано / обновлено / без изменений / ошибки"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []
+
+    def merge(self, other):
+        self.created += other.created
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.errors.extend(other.errors)
+        return self
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'unchanged': self.unchanged, 'errors': self.errors}
+
+    @classmethod
+    def from_dict(cls, data):
+        result = cls()
+        result.created = data['created']
+        result.updated = data['updated']
+        result.unchanged = data.get('unchanged', 0)
+        result.errors = list(data['errors'])
+        return result
+
+    def summary(self, max_errors=20):
+        report = (
+            f"Импорт завершён!\nСоздано: {self.created}\nОбновлено: {self.updated}\n"
+            f"Без изменений: {self.unchanged}\nОшибок: {len(self.errors)}"
+        )
+        if self.errors:
+            report += "\n\nОшибки:\n" + "\n".join(self.errors[:max_errors])
+        return report
+
+
+class StudentImporter:
+    """
+    Импорт студентов пачками:
+    - существующие email подгружаются одним запросом на пачку
+    - проверка строк — поколоночно по всему куску (validate_frame), до любой записи в БД
+    - строки делятся на новые, изменённые и неизменные; неизменные не пишутся вовсе
+    - новые пишутся через bulk_create(update_conflicts=True), изменённые — через bulk_update
+    - файл читается потоково кусками по chunk_size строк, каждый кусок — своя транзакция
+    """
+
+    BATCH_SIZE = 1000
+    CHUNK_SIZE = 5000
+    UPDATE_FIELDS = ['full_name', 'gpa', 'status']
+
+    def __init__(self, batch_size=None, chunk_size=None, skip_rows=None):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        # {номер строки: номер строки, где этот email встретился впервые} — дубли из других шардов
+        self.skip_rows = {int(line): first for line, first in dict(skip_rows or {}).items()}
+        # email → первая строка, где он встретился; переживает границы кусков
+        self.seen_emails = {}
+        self.result = ImportResult()
+
+    @staticmethod
+    def iter_chunks(file_path, chunk_size=CHUNK_SIZE, start_row=2, end_row=None):
+        """
+        Потоковое чтение файла: DataFrame'ы по chunk_size строк, индекс — номер строки в файле.
+        start_row/end_row ограничивают диапазон строк [start_row, end_row) — для шардов.
+        """
+        if file_path.lower().endswith('.csv'):
+            # skip_blank_lines=False: пустые строки файла остаются строками DataFrame'а, поэтому
+            # индекс, skiprows и nrows считают одни и те же физические строки (шарды не перекрываются)
+            reader = pd.read_csv(
+                file_path, encoding='utf-8', chunksize=chunk_size,
+                skiprows=range(1, start_row - 1),
+                nrows=end_row - start_row if end_row is not None else None,
+                skip_blank_lines=False,
+            )
+            for chunk in reader:
+                chunk.index = chunk.index + start_row  # строка 1 — заголовок
+                chunk = chunk.dropna(how='all')  # пустые строки пропускаем, как и в XLSX
+                if not chunk.empty:
+                    yield chunk
+            return
+
+        # read_only-режим openpyxl не держит весь лист в памяти
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            header_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+            header = [str(col).strip() if col is not None else '' for col in header_row]
+            rows = sheet.iter_rows(
+                min_row=start_row,
+                max_row=end_row - 1 if end_row is not None else None,
+                values_only=True,
+            )
+            buffer = []
+            line = start_row - 1
+            for values in rows:
+                line += 1
+                if not any(v is not None for v in values):
+                    continue
+                buffer.append((line, values))
+                if len(buffer) >= chunk_size:
+                    yield StudentImporter._frame(header, buffer)
+                    buffer = []
+            if buffer:
+                yield StudentImporter._frame(header, buffer)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _frame(header, buffer):
+        lines = [line for line, _ in buffer]
+        return pd.DataFrame([values for _, values in buffer], columns=header, index=lines)
+
+    @staticmethod
+    def plan_shards(file_path, shards):
+        """
+        Разбивка файла на диапазоны строк для параллельного импорта.
+        Повторы email между строками закрепляются за первой строкой, поэтому
+        два шарда никогда не пишут один и тот же email.
+        """
+        emails = pd.concat([
+            StudentImporter.normalize_emails(chunk['email'])
+            for chunk in StudentImporter.iter_chunks(file_path)
+        ])
+        if emails.empty:
+            return []
+
+        first_line = emails.reset_index().drop_duplicates('email').set_index('email')['index']
+        duplicates = emails[emails.duplicated(keep='first') & (emails != '')]
+
+        plan = []
+        for lines in np.array_split(emails.index.to_numpy(), min(shards, len(emails))):
+            start, end = int(lines[0]), int(lines[-1]) + 1
+            in_range = duplicates[(duplicates.index >= start) & (duplicates.index < end)]
+            plan.append({
+                'start_row': start,
+                'end_row': end,
+                'skip_rows': [[int(line), int(first_line[email])] for line, email in in_range.items()],
+            })
+        return plan
+
+    @staticmethod
+    def strip_emails(column):
+        return column.fillna('').astype(str).str.strip()
+
+    @staticmethod
+    def normalize_emails(column):
+        """Ключ сравнения email: без пробелов и регистра (хранится email как в файле)"""
+        return StudentImporter.strip_emails(column).str.lower()
+
+    @staticmethod
+    def validate_frame(df, earlier=None):
+        """
+        Поколоночная проверка куска (pandas вместо цикла по строкам).
+        earlier — по строкам df номер строки, где email уже встречался раньше (в прошлых кусках, в других шардах).
+        Возвращает (чистые строки, таблица ошибок row/field/message); строки с ошибками в чистые не попадают.
+        """
+        for column in ('email', 'full_name'):
+            if column not in df.columns:
+                raise ValueError(f"В файле нет колонки '{column}'")
+
+        lines = pd.Series(df.index, index=df.index)
+        raw_email = StudentImporter.strip_emails(df['email'])
+        email = raw_email.str.lower()
+        full_name = df['full_name'].fillna('').astype(str).str.strip()
+
+        # GPA: пусто → 0.0, не число или вне диапазона validate_gpa → ошибка
+        raw_gpa = df['gpa'] if 'gpa' in df.columns else pd.Series(np.nan, index=df.index)
+        gpa = pd.to_numeric(raw_gpa, errors='coerce')
+        not_number = gpa.isna() & raw_gpa.notna() & (raw_gpa.astype(str).str.strip() != '')
+        gpa = gpa.fillna(0.0).round(2)
+        out_of_range = ~not_number & ((gpa < 0) | (gpa > 4.0))
+
+        # Статус: принимаем и код, и русское название из STATUS_CHOICES; неизвестный → active
+        raw_status = df['status'] if 'status' in df.columns else pd.Series('', index=df.index)
+        status = raw_status.fillna('').astype(str).str.strip().str.lower().map(STATUS_LOOKUP).fillna('active')
+
+        # Повтор — любое непустое вхождение после первого, даже если первое само с ошибками:
+        # так же считают кусок за куском (import_frame) и разбивка на шарды (plan_shards)
+        first_line = lines.groupby(email.values).transform('min')
+        duplicated = email.duplicated(keep='first')
+        if earlier is not None:
+            first_line = earlier.reindex(df.index).fillna(first_line).astype(int)
+            duplicated |= earlier.reindex(df.index).notna()
+        duplicated &= email != ''
+
+        checks = [
+            (email == '', 'email', 'обязательное поле'),
+            ((email != '') & ~email.str.match(EMAIL_PATTERN), 'email', 'некорректный email'),
+            (duplicated, 'email', 'повтор, впервые в строке ' + first_line.astype(str)),
+            (email.str.len() > EMAIL_MAX_LENGTH, 'email', f'длиннее {EMAIL_MAX_LENGTH} символов'),
+            (full_name == '', 'full_name', 'обязательное поле'),
+            (full_name.str.len() > FULL_NAME_MAX_LENGTH, 'full_name', f'длиннее {FULL_NAME_MAX_LENGTH} символов'),
+            (not_number, 'gpa', 'не число'),
+            (out_of_range, 'gpa', 'GPA должен быть от 0 до 4.0'),
+        ]
+        errors = pd.concat([
+            pd.DataFrame({
+                'row': lines[mask],
+                'field': field,
+                'message': message[mask] if isinstance(message, pd.Series) else message,
+            })
+            for mask, field, message in checks
+        ], ignore_index=True).sort_values('row', kind='stable')
+
+        clean = pd.DataFrame({'email': raw_email, 'email_key': email, 'full_name': full_name, 'gpa': gpa, 'status': status})
+        clean = clean[~clean.index.isin(errors['row'])]
+        return clean, errors
+
+    def import_file(self, file_path, start_row=2, end_row=None):
+        # Коммит на каждый кусок: память и длина транзакции не зависят от размера файла
+        for chunk in self.iter_chunks(file_path, self.chunk_size, start_row, end_row):
+            with transaction.atomic():
+                self.import_frame(chunk)
+        return self.result
+
+    def import_frame(self, df):
+        """Импорт одного куска; индекс df — номер строки в файле"""
+        # Повторы email из предыдущих кусков (и из других шардов — через skip_rows).
+        # Запоминаем все непустые email куска, а не только чистые строки: итог не зависит от размера куска
+        keys = self.normalize_emails(df['email']) if 'email' in df.columns else pd.Series('', index=df.index)
+        earlier = keys.map(self.seen_emails).astype(float)
+        skipped = [line for line in df.index if line in self.skip_rows]
+        if skipped:
+            earlier[skipped] = [self.skip_rows[line] for line in skipped]
+        clean, errors = self.validate_frame(df, earlier)
+
+        new = (keys != '') & earlier.isna() & ~keys.duplicated()
+        self.seen_emails.update(zip(keys[new], keys.index[new]))
+        self.result.errors.extend(
+            f"Строка {row}: {field}: {message}" for row, field, message in errors.itertuples(index=False)
+        )
+
+        rows = list(zip(clean.index, clean.to_dict('records')))
+
+        for start in range(0, len(rows), self.batch_size):
+            self.write_batch(rows[start:start + self.batch_size])
+        return self.result
+
+    def write_batch(self, rows):
+        """Запись одной пачки строк: 1 SELECT + bulk INSERT + bulk UPDATE; аудит уходит на коммит куска"""
+        keys = {data['email_key'] for _, data in rows}
+        # Снимок текущего состояния: email без регистра → (full_name, gpa, status).
+        # Строки, сохранённые через API как Ivan@Uni.ru, совпадают с ivan@uni.ru из файла (индекс по Lower('email'));
+        # если в БД есть варианты одного email в разном регистре — берём самый старый
+        existing = {
+            s.email_key: s for s in Student.objects.annotate(email_key=Lower('email'))
+            .filter(email_key__in=keys).order_by('-id').only('id', 'email', *self.UPDATE_FIELDS)
+        }
+
+        to_create = {}
+        to_update = {}
+        unchanged = 0
+        for line, data in rows:
+            email = data['email_key']
+            student = existing.get(email)
+            if student is None:
+                to_create[email] = Student(
+                    email=data['email'], **{field: data[field] for field in self.UPDATE_FIELDS}
+                )
+                continue
+
+            changes = self.diff(student, data)
+            if not changes:
+                # Ничего не поменялось — не пишем строку и не плодим пустые записи аудита
+                unchanged += 1
+                continue
+
+            for field in self.UPDATE_FIELDS:
+                setattr(student, field, data[field])
+            to_update[email] = (student, changes)
+
+        try:
+            with transaction.atomic():
+                if to_create:
+                    Student.objects.bulk_create(
+                        to_create.values(),
+                        batch_size=self.batch_size,
+                        update_conflicts=True,
+                        unique_fields=['email'],
+                        update_fields=self.UPDATE_FIELDS,
+                    )
+                if to_update:
+                    Student.objects.bulk_update(
+                        [student for student, _ in to_update.values()], self.UPDATE_FIELDS, batch_size=self.batch_size
+                    )
+                self.log_audit(to_create.values(), to_update.values())
+        except Exception as e:
+            if len(rows) > 1:
+                # Пачка откачена целиком — повторяем построчно, чтобы отклонить только плохие строки
+                for row in rows:
+                    self.write_batch([row])
+                return
+            self.result.errors.append(f"Строка {rows[0][0]}: {str(e)}")
+            return
+
+        if to_create or to_update:
+            # bulk-операции не шлют post_save — версию таблицы для кэша поднимаем сами
+            UniversityCache.invalidate_model(Student)
+
+        self.result.created += len(to_create)
+        self.result.updated += len(to_update)
+        self.result.unchanged += unchanged
+
+    @classmethod
+    def diff(cls, student, data):
+        """Изменённые поля в формате AuditLog.changes; пустой dict — строка не изменилась"""
+        incoming = {
+            'full_name': data['full_name'],
+            'gpa': Decimal(str(data['gpa'])).quantize(GPA_QUANTUM),
+            'status': data['status'],
+        }
+        changes = {}
+        for field in cls.UPDATE_FIELDS:
+            old_val = getattr(student, field)
+            if old_val != incoming[field]:
+                changes[Student._meta.get_field(field).verbose_name] = {'old': str(old_val), 'new': str(incoming[field])}
+        return changes
+
+    def log_audit(self, created, updated):
+        # bulk-операции не вызывают post_save, поэтому аудит пишем сами — в буфер транзакции куска
+        model_name = Student._meta.verbose_name
+        entries = [
+            AuditLog(action='create', model_name=model_name, object_id=s.pk, object_repr=audit.object_repr(s))
+            for s in created
+        ] + [
+            AuditLog(
+                action='update', model_name=model_name, object_id=s.pk,
+                object_repr=audit.object_repr(s), changes=changes,
+            )
+            for s, changes in updated
+        ]
+        audit.record_many(entries)
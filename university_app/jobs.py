@@ -0,0 +1,178 @@
+# university_app/jobs.py — фоновые отчёты: заказ, дедупликация, выполнение в Celery, хранение результата
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+from .models import ReportJob
+from .reports import UniversityReports
+
+logger = logging.getLogger(__name__)
+
+
+class ReportSpec:
+    """Отчёт, доступный для фонового заказа: функция, её параметры и роли"""
+
+    def __init__(self, func, params=None, roles=('admin', 'teacher')):
+        self.func = func
+        # имя параметра → (тип: int | list, обязателен)
+        self.params = params or {}
+        self.roles = roles
+
+    def clean_params(self, raw):
+        raw = raw or {}
+        unknown = set(raw) - set(self.params)
+        if unknown:
+            raise ValidationError({'params': f"Неизвестные параметры: {', '.join(sorted(unknown))}"})
+        cleaned = {}
+        for name, (kind, required) in self.params.items():
+            value = raw.get(name)
+            if value is None:
+                if required:
+                    raise ValidationError({'params': f"{name}: обязательный параметр"})
+                continue
+            try:
+                cleaned[name] = sorted({int(item) for item in value}) if kind is list else int(value)
+            except (TypeError, ValueError):
+                raise ValidationError({'params': f"{name}: ожидается {'список целых чисел' if kind is list else 'целое число'}"})
+        return cleaned
+
+
+REPORTS = {
+    'students_above_average': ReportSpec(UniversityReports.students_above_course_average),
+    'teacher_schedule': ReportSpec(UniversityReports.teacher_week_schedule, {'teacher_id': (int, True)}),
+    'course_average': ReportSpec(UniversityReports.course_average_grade, {'course_id': (int, True)}),
+    'course_statistics': ReportSpec(
+        UniversityReports.course_statistics, {'course_ids': (list, False), 'teacher_id': (int, False)}
+    ),
+    'top_5_students': ReportSpec(UniversityReports.top_5_students_by_gpa, roles=('admin',)),
+    'debtors': ReportSpec(UniversityReports.debtors_with_debt_amount, roles=('admin',)),
+}
+
+
+class ReportJobs:
+    """
+    Жизненный цикл фонового отчёта:
+    submit → pending → (Celery) running → done / failed; результат — JSON в MEDIA_ROOT/reports/jobs,
+    живёт REPORT_JOB_TTL секунд. Одинаковый заказ (отчёт + параметры) получает уже существующую
+    задачу, пока она в работе или её результат не истёк.
+    """
+
+    @staticmethod
+    def get_result_dir():
+        return getattr(settings, 'REPORT_JOBS_DIR', os.path.join(settings.MEDIA_ROOT, 'reports', 'jobs'))
+
+    @staticmethod
+    def get_params_hash(report, params):
+        payload = json.dumps({'report': report, 'params': params}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def find_reusable(params_hash):
+        return (
+            ReportJob.objects.filter(params_hash=params_hash, status__in=ReportJob.ACTIVE_STATUSES).first()
+            or ReportJob.objects.filter(params_hash=params_hash, status='done', expires_at__gt=timezone.now())
+            .order_by('-finished_at').first()
+        )
+
+    @staticmethod
+    def submit(report, params, user=None):
+        """(job, created): новая задача или уже существующая с тем же хэшем"""
+        spec = REPORTS[report]
+        params = spec.clean_params(params)
+        params_hash = ReportJobs.get_params_hash(report, params)
+
+        job = ReportJobs.find_reusable(params_hash)
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                job = ReportJob.objects.create(report=report, params=params, params_hash=params_hash, user=user)
+        except IntegrityError:
+            # параллельный заказ успел первым — уникальность активного хэша гарантирует БД
+            # (к этому моменту его задача могла и завершиться — поэтому тот же поиск, что и выше)
+            job = ReportJobs.find_reusable(params_hash)
+            if job is None:
+                return ReportJobs.submit(report, params, user)
+            return job, False
+        transaction.on_commit(lambda: ReportJobs.enqueue(job))
+        return job, True
+
+    @staticmethod
+    def enqueue(job):
+        from .tasks import run_report_job
+        try:
+            run_report_job.apply_async(args=[str(job.pk)], retry=False)
+        except Exception as exc:
+            logger.exception("Report job %s not queued", job.pk)
+            ReportJobs.finish(job, error=f"Не удалось поставить в очередь: {exc}")
+
+    @staticmethod
+    def run(job_id):
+        """Выполнение задачи (в воркере Celery)"""
+        updated = ReportJob.objects.filter(pk=job_id, status='pending').update(status='running')
+        if not updated:
+            return None  # уже выполнена или взята другим воркером
+        job = ReportJob.objects.get(pk=job_id)
+        try:
+            data = REPORTS[job.report].func(**job.params)
+        except Exception as exc:
+            logger.exception("Report job %s failed", job_id)
+            ReportJobs.finish(job, error=str(exc))
+            return job
+
+        result_dir = ReportJobs.get_result_dir()
+        os.makedirs(result_dir, exist_ok=True)
+        filename = f"{job.pk}.json"
+        with open(os.path.join(result_dir, filename), 'w', encoding='utf-8') as f:
+            json.dump({
+                'report': job.report,
+                'params': job.params,
+                'generated_at': timezone.now().isoformat(),
+                'data': data,
+            }, f, cls=JSONEncoder, ensure_ascii=False)
+        ReportJobs.finish(job, result_file=filename)
+        return job
+
+    @staticmethod
+    def finish(job, result_file='', error=''):
+        now = timezone.now()
+        job.status = 'failed' if error else 'done'
+        job.result_file = result_file
+        job.error = error
+        job.finished_at = now
+        # упавшая задача хранится ради текста ошибки, но не переиспользуется (см. find_reusable)
+        job.expires_at = now + timedelta(seconds=settings.REPORT_JOB_TTL)
+        job.save(update_fields=['status', 'result_file', 'error', 'finished_at', 'expires_at'])
+
+    @staticmethod
+    def get_result_path(job):
+        if job.status != 'done' or not job.result_file or job.expires_at <= timezone.now():
+            return None
+        path = os.path.join(ReportJobs.get_result_dir(), job.result_file)
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def purge():
+        """Удаление истёкших задач с файлами и снятие зависших (упавший воркер) — возвращает число удалённых"""
+        now = timezone.now()
+        stuck = ReportJob.objects.filter(
+            status__in=ReportJob.ACTIVE_STATUSES,
+            created_at__lt=now - timedelta(seconds=settings.REPORT_JOB_TIMEOUT),
+        )
+        stuck.update(status='failed', error='Превышено время выполнения', finished_at=now,
+                     expires_at=now + timedelta(seconds=settings.REPORT_JOB_TTL))
+
+        expired = list(ReportJob.objects.filter(expires_at__lte=now).values_list('pk', 'result_file'))
+        result_dir = ReportJobs.get_result_dir()
+        for _, result_file in expired:
+            path = os.path.join(result_dir, result_file) if result_file else None
+            if path and os.path.exists(path):
+                os.remove(path)
+        ReportJob.objects.filter(pk__in=[pk for pk, _ in expired]).delete()
+        return len(expired)
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from university_app.archive import AuditArchive
+
+
+class Command(BaseCommand):
+    help = 'Перенос старых записей журнала аудита в сжатый архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.AUDIT_RETENTION_DAYS,
+                            help='Архивировать записи старше N дней')
+        parser.add_argument('--segment-size', type=int, default=AuditArchive.SEGMENT_SIZE,
+                            help='Записей в одном сегменте (и в одной пачке удаления)')
+
+    def handle(self, *args, **options):
+        manifests = AuditArchive.archive(options['days'], options['segment_size'])
+        for manifest in manifests:
+            self.stdout.write(f"  • {manifest['segment']}: {manifest['count']} записей ({manifest['start']} — {manifest['end']})")
+        total = sum(m['count'] for m in manifests)
+        self.stdout.write(self.style.SUCCESS(f"В архив перенесено {total} записей, сегментов: {len(manifests)}"))
@@ -0,0 +1,54 @@
+import time
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+from university_app import views
+from university_app.models import User
+
+VIEWSETS = {
+    'enrollments': views.EnrollmentViewSet,
+    'schedules': views.ScheduleViewSet,
+    'courses': views.CourseViewSet,
+    'students': views.StudentViewSet,
+    'payments': views.PaymentViewSet,
+}
+
+
+class Command(BaseCommand):
+    help = 'Сравнение list-эндпоинтов: ModelSerializer против быстрого пути через .values()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--only', nargs='+', choices=list(VIEWSETS), help='Только эти вьюсеты')
+
+    @staticmethod
+    def request(factory, view, name, user, page_size):
+        request = factory.get(f'/api/{name}/', {'page_size': page_size, 'pagination': 'page'})
+        force_authenticate(request, user=user)
+        response = view(request)
+        response.render()
+        return response.content
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        # администратор без записи в БД: get_queryset отдаёт всё, аутентификация не ходит в базу
+        user = User(username='benchmark', role='admin')
+        self.stdout.write(f"{'Вьюсет':<14}{'Сериализатор, мс':>18}{'.values(), мс':>16}{'Ускорение':>12}  Вывод")
+
+        for name in options['only'] or VIEWSETS:
+            timings, contents = {}, {}
+            for fast in (False, True):
+                view = VIEWSETS[name].as_view({'get': 'list'}, fast_list=fast)
+                # первый запрос не считаем: он заполняет кэш версий таблиц и счётчика страниц
+                contents[fast] = self.request(factory, view, name, user, options['page_size'])
+                started = time.perf_counter()
+                for _ in range(options['iterations']):
+                    self.request(factory, view, name, user, options['page_size'])
+                timings[fast] = (time.perf_counter() - started) / options['iterations'] * 1000
+
+            identical = contents[False] == contents[True]
+            speedup = timings[False] / timings[True] if timings[True] else 0
+            self.stdout.write(
+                f"{name:<14}{timings[False]:>18.2f}{timings[True]:>16.2f}{speedup:>11.1f}x  "
+                + (self.style.SUCCESS("идентичен") if identical else self.style.ERROR("РАЗЛИЧАЕТСЯ"))
+            )
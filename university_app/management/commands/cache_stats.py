@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from university_app.cache import UniversityCache, CacheMetrics
+
+
+class Command(BaseCommand):
+    help = 'Статистика кэша университета по наборам данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счётчики')
+
+    def handle(self, *args, **options):
+        families = list(UniversityCache.DATASETS)
+        if options['reset']:
+            CacheMetrics.reset(families)
+            self.stdout.write(self.style.SUCCESS("Счётчики обнулены"))
+            return
+
+        stats = CacheMetrics.snapshot(families)
+        self.stdout.write(f"{'Набор':<12}{'L1 hit':>10}{'L2 hit':>10}{'Промах':>10}{'Hit %':>8}{'Сборок':>8}{'Ср. мс':>8}")
+        for family, counters in stats.items():
+            hits = counters['local_hits'] + counters['shared_hits']
+            requests = hits + counters['misses']
+            hit_rate = hits / requests * 100 if requests else 0
+            avg_ms = counters['rebuild_ms'] / counters['rebuilds'] if counters['rebuilds'] else 0
+            self.stdout.write(
+                f"{family:<12}{counters['local_hits']:>10}{counters['shared_hits']:>10}{counters['misses']:>10}"
+                f"{hit_rate:>8.1f}{counters['rebuilds']:>8}{avg_ms:>8.1f}"
+            )
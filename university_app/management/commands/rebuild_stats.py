@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from university_app.cache import UniversityCache
+from university_app.models import Enrollment, Payment
+from university_app.stats import UniversityStats
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчёт сводных таблиц (статистика курсов, задолженности студентов)'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Пересчитываем сводные таблицы...")
+        counts = UniversityStats.rebuild()
+        # наборы кэша строятся из сводок — сбрасываем их
+        UniversityCache.invalidate_model(Enrollment)
+        UniversityCache.invalidate_model(Payment)
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: курсов {counts['courses']}, студентов с долгом {counts['debts']}"
+        ))
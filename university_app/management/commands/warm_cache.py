@@ -5,16 +5,19 @@ from university_app.cache import UniversityCache
 class Command(BaseCommand):
     help = 'Прогрев кэша университета'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Потоков для параллельной пересборки')
+        parser.add_argument('--only', nargs='+', choices=list(UniversityCache.WARMUP), help='Только эти наборы')
+        parser.add_argument('--ahead', type=int, default=None,
+                            help='Пересобирать только записи, которым до устаревания осталось меньше N секунд')
+
     def handle(self, *args, **options):
         self.stdout.write("Прогреваем кэш...")
 
-        UniversityCache.get_courses()
-        self.stdout.write(self.style.SUCCESS("✓ Курсы закэшированы"))
-
-        UniversityCache.get_schedule()
-        self.stdout.write(self.style.SUCCESS("✓ Расписание закэшировано"))
-
-        UniversityCache.get_debtors()
-        self.stdout.write(self.style.SUCCESS("✓ Отчёт по долгам закэширован"))
+        stats = UniversityCache.warm(names=options['only'], workers=options['workers'], ahead=options['ahead'])
+        for name, item in stats.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {name}: пересобрано {item['rebuilt']} из {item['entries']} за {item['seconds']:.2f} с"
+            ))
 
         self.stdout.write(self.style.SUCCESS("Кэш успешно прогрет!"))
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.14 on 2026-10-18 04:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_summary_tables(apps, schema_editor):
+    """Начальное заполнение сводок; дальше их поддерживает university_app.stats"""
+    Enrollment = apps.get_model('university_app', 'Enrollment')
+    Payment = apps.get_model('university_app', 'Payment')
+    CourseGradeStats = apps.get_model('university_app', 'CourseGradeStats')
+    StudentDebt = apps.get_model('university_app', 'StudentDebt')
+
+    CourseGradeStats.objects.bulk_create([
+        CourseGradeStats(course_id=row['course_id'], total=row['total'], graded=row['graded'],
+                         grade_sum=row['grade_sum'] or 0, passed=row['passed'])
+        for row in Enrollment.objects.values('course_id').annotate(
+            total=Count('id'), graded=Count('grade'), grade_sum=Sum('grade'),
+            passed=Count('id', filter=Q(passed=True)),
+        ).order_by()
+    ], batch_size=1000)
+    StudentDebt.objects.bulk_create([
+        StudentDebt(student_id=row['student_id'], debt=row['debt'])
+        for row in Payment.objects.filter(status__in=['pending', 'overdue'])
+        .values('student_id').annotate(debt=Sum('amount')).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('university_app', '0002_auditlog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseGradeStats',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='grade_stats', serialize=False, to='university_app.course', verbose_name='Курс')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('graded', models.PositiveIntegerField(default=0, verbose_name='С оценкой')),
+                ('grade_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('passed', models.PositiveIntegerField(default=0, verbose_name='Зачтено')),
+            ],
+            options={
+                'verbose_name': 'Статистика курса',
+                'verbose_name_plural': 'Статистика курсов',
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentDebt',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='debt_summary', serialize=False, to='university_app.student', verbose_name='Студент')),
+                ('debt', models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12, verbose_name='Задолженность')),
+            ],
+            options={
+                'verbose_name': 'Задолженность студента',
+                'verbose_name_plural': 'Задолженности студентов',
+            },
+        ),
+        migrations.RunPython(fill_summary_tables, migrations.RunPython.noop),
+    ]
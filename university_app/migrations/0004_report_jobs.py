@@ -0,0 +1,37 @@
+# Generated by Django 5.1.14 on 2026-10-18 04:43
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('university_app', '0003_summary_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('report', models.CharField(max_length=100, verbose_name='Отчёт')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Параметры')),
+                ('params_hash', models.CharField(db_index=True, max_length=64, verbose_name='Хэш отчёта и параметров')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готов'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('result_file', models.CharField(blank=True, max_length=255, verbose_name='Файл результата')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершён')),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Хранится до')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Заказчик')),
+            ],
+            options={
+                'verbose_name': 'Фоновый отчёт',
+                'verbose_name_plural': 'Фоновые отчёты',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('params_hash',), name='reportjob_active_hash_uniq')],
+            },
+        ),
+    ]
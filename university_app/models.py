@@ -1,5 +1,7 @@
+import uuid
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import DatabaseError, connections, models, router, transaction
+from django.db.models.functions import Lower
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 
@@ -9,8 +11,83 @@ def validate_gpa(value):
         raise ValidationError('GPA должен быть от 0 до 4.0')
 
 
+# === ОТСЛЕЖИВАНИЕ ИЗМЕНЕНИЙ ===
+class TrackedFieldsMixin:
+    """
+    Запоминает значения полей при загрузке из БД (from_db).
+    Аудит считает diff в памяти без повторного SELECT, а save() пишет только изменённые поля.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _snapshot(self):
+        self._loaded_values = {
+            f.attname: self.__dict__[f.attname]
+            for f in self._meta.concrete_fields if f.attname in self.__dict__
+        }
+
+    def get_loaded_values(self):
+        """Значения полей на момент загрузки/последнего сохранения (attname → значение) или None"""
+        return getattr(self, '_loaded_values', None)
+
+    def get_changed_fields(self):
+        """attname изменённых полей; None — если исходное состояние неизвестно"""
+        loaded = self.get_loaded_values()
+        if loaded is None:
+            return None
+        changed = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue  # отложенные (defer/only) и нетронутые поля не пишем
+            if (field.attname not in loaded or loaded[field.attname] != self.__dict__[field.attname]
+                    or getattr(field, 'auto_now', False)):
+                changed.append(field.attname)
+        return changed
+
+    def save(self, *args, **kwargs):
+        partial = False
+        if not args and not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            loaded = self.get_loaded_values()
+            changed = self.get_changed_fields()
+            # клон (obj.pk = None) или смена pk — обычный save(), иначе пустой update_fields ничего не вставит
+            if changed is not None and self.pk is not None and loaded.get(self._meta.pk.attname) == self.pk:
+                # пустой список — Django вообще не пойдёт в БД (и не пошлёт сигналы)
+                partial = True
+        try:
+            super().save(*args, **(dict(kwargs, update_fields=changed) if partial else kwargs))
+        except DatabaseError as exc:
+            # строку удалили после загрузки: UPDATE с update_fields не затронул ни одной строки.
+            # Как и без update_fields — вставляем заново; ошибки самой БД (с __cause__) пробрасываем
+            if not partial or not changed or exc.__cause__ is not None:
+                raise
+            using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+            if connections[using].in_atomic_block:
+                # запрос в БД не падал — ошибку поднял сам Django, откатывать транзакцию незачем
+                transaction.set_rollback(False, using=using)
+            super().save(*args, **kwargs)
+        self._snapshot()
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        loaded = self.get_loaded_values()
+        if fields is None or loaded is None:
+            self._snapshot()
+            return
+        # загрузка отложенного поля тоже идёт сюда: снимок обновляем только для перечитанных полей,
+        # несохранённые правки остальных полей должны остаться изменениями
+        fields = set(fields)
+        for field in self._meta.concrete_fields:
+            if (field.name in fields or field.attname in fields) and field.attname in self.__dict__:
+                loaded[field.attname] = self.__dict__[field.attname]
+
+
 # === КАСТОМНЫЙ ПОЛЬЗОВАТЕЛЬ С РОЛЯМИ ===
-class User(AbstractUser):
+class User(TrackedFieldsMixin, AbstractUser):
     ROLE_CHOICES = [
         ('admin', 'Администратор'),
         ('teacher', 'Преподаватель'),
@@ -57,7 +134,7 @@ class User(AbstractUser):
 
 
 # === КАФЕДРА ===
-class Department(models.Model):
+class Department(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=200, unique=True, verbose_name='Название кафедры')
 
     def __str__(self):
@@ -69,7 +146,7 @@ class Department(models.Model):
 
 
 # === ПРЕПОДАВАТЕЛЬ ===
-class Teacher(models.Model):
+class Teacher(TrackedFieldsMixin, models.Model):
     POSITION_CHOICES = [
         ('assistant', 'Ассистент'),
         ('lecturer', 'Старший преподаватель'),
@@ -91,7 +168,7 @@ class Teacher(models.Model):
 
 
 # === СТУДЕНТ ===
-class Student(models.Model):
+class Student(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('active', 'Обучается'),
         ('academic_leave', 'Академический отпуск'),
@@ -113,10 +190,14 @@ class Student(models.Model):
     class Meta:
         verbose_name = 'Студент'
         verbose_name_plural = 'Студенты'
+        indexes = [
+            # импорт сопоставляет email без учёта регистра
+            models.Index(Lower('email'), name='student_email_lower_idx'),
+        ]
 
 
 # === КУРС ===
-class Course(models.Model):
+class Course(TrackedFieldsMixin, models.Model):
     name = models.CharField(max_length=200, verbose_name='Название курса')
     description = models.TextField(blank=True, verbose_name='Описание')
     credits = models.PositiveSmallIntegerField(verbose_name='Кредиты (ECTS)')
@@ -134,7 +215,7 @@ class Course(models.Model):
 
 
 # === ЗАПИСЬ НА КУРС ===
-class Enrollment(models.Model):
+class Enrollment(TrackedFieldsMixin, models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='enrollments', verbose_name='Студент')
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments', verbose_name='Курс')
     enrollment_date = models.DateField(auto_now_add=True, verbose_name='Дата записи')
@@ -150,9 +231,15 @@ class Enrollment(models.Model):
         verbose_name = 'Запись на курс'
         verbose_name_plural = 'Записи на курсы'
 
-    def save(self, *args, **kwargs):
-        if self.grade is not None and self.grade >= 60:
+    PASS_GRADE = 60
+
+    def update_passed(self):
+        """Зачёт по оценке; общий для save() и массового обновления (bulk.py)"""
+        if self.grade is not None and self.grade >= self.PASS_GRADE:
             self.passed = True
+
+    def save(self, *args, **kwargs):
+        self.update_passed()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -160,7 +247,7 @@ class Enrollment(models.Model):
 
 
 # === РАСПИСАНИЕ ===
-class Schedule(models.Model):
+class Schedule(TrackedFieldsMixin, models.Model):
     DAY_OF_WEEK = [
         ('monday', 'Понедельник'), ('tuesday', 'Вторник'), ('wednesday', 'Среда'),
         ('thursday', 'Четверг'), ('friday', 'Пятница'), ('saturday', 'Суббота'), ('sunday', 'Воскресенье'),
@@ -183,7 +270,7 @@ class Schedule(models.Model):
 
 
 # === ЭКЗАМЕН ===
-class Exam(models.Model):
+class Exam(TrackedFieldsMixin, models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name='Курс')
     date = models.DateTimeField(verbose_name='Дата и время экзамена')
 
@@ -195,7 +282,7 @@ class Exam(models.Model):
         verbose_name_plural = 'Экзамены'
 
 
-class ExamResult(models.Model):
+class ExamResult(TrackedFieldsMixin, models.Model):
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     grade = models.PositiveSmallIntegerField(
@@ -211,7 +298,7 @@ class ExamResult(models.Model):
 
 
 # === ПЛАТЁЖ ===
-class Payment(models.Model):
+class Payment(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('pending', 'Ожидает оплаты'),
         ('paid', 'Оплачено'),
@@ -233,6 +320,34 @@ class Payment(models.Model):
         verbose_name_plural = 'Платежи'
 
 
+# === СВОДНЫЕ ТАБЛИЦЫ (поддерживаются инкрементально, см. stats.py) ===
+class CourseGradeStats(models.Model):
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='grade_stats', verbose_name='Курс')
+    total = models.PositiveIntegerField(default=0, verbose_name='Записей')
+    graded = models.PositiveIntegerField(default=0, verbose_name='С оценкой')
+    grade_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')
+    passed = models.PositiveIntegerField(default=0, verbose_name='Зачтено')
+
+    class Meta:
+        verbose_name = 'Статистика курса'
+        verbose_name_plural = 'Статистика курсов'
+
+    def __str__(self):
+        return f"Курс #{self.course_id}: {self.passed}/{self.total}"
+
+
+class StudentDebt(models.Model):
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='debt_summary', verbose_name='Студент')
+    debt = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True, verbose_name='Задолженность')
+
+    class Meta:
+        verbose_name = 'Задолженность студента'
+        verbose_name_plural = 'Задолженности студентов'
+
+    def __str__(self):
+        return f"Студент #{self.student_id}: {self.debt} ₽"
+
+
 # === АУДИТ-ЛОГ ===
 class AuditLog(models.Model):
     ACTION_CHOICES = [
@@ -253,6 +368,49 @@ class AuditLog(models.Model):
         verbose_name = 'Журнал аудита'
         verbose_name_plural = 'Журнал аудита'
         ordering = ['-timestamp']
+        # Все индексы заканчиваются на (timestamp, id) — под keyset-пагинацию API аудита
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='auditlog_ts_idx'),
+            models.Index(fields=['model_name', 'object_id', 'timestamp', 'id'], name='auditlog_object_ts_idx'),
+            models.Index(fields=['user', 'timestamp', 'id'], name='auditlog_user_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user or 'Система'} — {self.get_action_display()} — {self.object_repr}"
+
+
+# === ФОНОВЫЕ ОТЧЁТЫ ===
+class ReportJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готов'),
+        ('failed', 'Ошибка'),
+    ]
+    ACTIVE_STATUSES = ('pending', 'running')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    report = models.CharField(max_length=100, verbose_name='Отчёт')
+    params = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    params_hash = models.CharField(max_length=64, db_index=True, verbose_name='Хэш отчёта и параметров')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Заказчик')
+    result_file = models.CharField(max_length=255, blank=True, verbose_name='Файл результата')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершён')
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name='Хранится до')
+
+    class Meta:
+        verbose_name = 'Фоновый отчёт'
+        verbose_name_plural = 'Фоновые отчёты'
+        constraints = [
+            # одинаковые одновременные заказы: в очереди/работе может быть только одна задача
+            models.UniqueConstraint(
+                fields=['params_hash'], condition=models.Q(status__in=['pending', 'running']),
+                name='reportjob_active_hash_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.report} ({self.get_status_display()})"
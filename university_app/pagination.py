@@ -0,0 +1,200 @@
+# university_app/pagination.py — keyset-пагинация без COUNT(*) и OFFSET
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import cached_property, partial
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (seek method):
+        WHERE (timestamp, id) < (:ts, :id) ORDER BY timestamp DESC, id DESC LIMIT n
+    Курсор хранит значения полей сортировки последней строки страницы, поэтому
+    любая страница стоит столько же, сколько первая. Последнее поле сортировки
+    должно быть уникальным (id); сортировка задаётся во view через keyset_ordering.
+    """
+
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+        self.field_names = [name.lstrip('-') for name in self.ordering]
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(position))
+
+        # +1 строка — чтобы узнать, есть ли следующая страница, без COUNT(*)
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = [self.get_value(rows[-1], name) for name in self.field_names] if self.has_next else None
+        return rows
+
+    def seek_filter(self, position):
+        """(a, b, c) после (x, y, z) ⇔ a ≷ x ИЛИ (a = x И b ≷ y) ИЛИ (a = x И b = y И c ≷ z)"""
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    @staticmethod
+    def get_value(row, name):
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, name)
+
+    def encode_cursor(self, position):
+        values = [value if isinstance(value, (int, str)) else
+                  value.isoformat() if hasattr(value, 'isoformat') else str(value)
+                  for value in position]
+        encoded = urlsafe_b64encode(json.dumps(values).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if len(values) != len(self.field_names):
+                raise ValueError
+            return [model._meta.get_field(name).to_python(value) for name, value in zip(self.field_names, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        return self.encode_cursor(self.next_position) if self.has_next else None
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+# === ЗАКЭШИРОВАННЫЙ COUNT(*) ===
+COUNT_TIMEOUT = 60 * 5
+
+
+def get_count_key(queryset, models):
+    """Ключ счётчика: SQL запроса (с фильтрами области видимости) + версии таблиц — меняются вместе с данными"""
+    from .cache import UniversityCache
+    # values('pk'): запросы, отличающиеся только набором колонок (?fields=), делят один счётчик
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    digest = hashlib.sha1(f"{sql}|{params}".encode()).hexdigest()
+    versions = UniversityCache.get_versions(models)
+    return f"count:{queryset.model._meta.label_lower}:{digest}:v{'.'.join(map(str, versions))}"
+
+
+def cached_count(queryset, models):
+    key = get_count_key(queryset, models)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, чей count берётся из кэша до изменения таблиц"""
+
+    def __init__(self, *args, count_models=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_models = count_models
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list, self.count_models)
+
+
+class HybridPagination(PageNumberPagination):
+    """
+    Два режима:
+    - page — обычные номера страниц (count из кэша);
+    - cursor — KeysetPagination: любая страница стоит как первая, count — из кэша.
+    По умолчанию page (вьюсет может сменить через pagination_mode), клиент — ?pagination=page|cursor;
+    наличие ?cursor= всегда означает cursor, наличие ?page= — page.
+    Без явной сортировки оба режима идут по возрастанию id.
+    """
+
+    mode_query_param = 'pagination'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_mode(self, request, view):
+        if request.query_params.get(KeysetPagination.cursor_query_param):
+            return 'cursor'
+        if request.query_params.get(self.page_query_param):
+            return 'page'
+        mode = request.query_params.get(self.mode_query_param)
+        if mode in ('page', 'cursor'):
+            return mode
+        return getattr(view, 'pagination_mode', 'page')
+
+    @staticmethod
+    def get_count_models(queryset, request, view):
+        """Таблицы вьюсета + таблицы области видимости роли — как в ETag (conditional.compute_etag)"""
+        from .scoping import SCOPE_MODELS
+        get_models = getattr(view, 'get_etag_models', None)
+        models = tuple(get_models()) if get_models else (queryset.model,)
+        return tuple(dict.fromkeys([*models, *SCOPE_MODELS.get(getattr(request.user, 'role', None), ())]))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.mode = self.get_mode(request, view)
+        self.count_models = self.get_count_models(queryset, request, view)
+        if self.mode == 'cursor':
+            self.queryset = queryset
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        if not queryset.ordered:
+            # стабильный порядок по индексу — иначе страницы с OFFSET могут пересекаться
+            queryset = queryset.order_by(*KeysetPagination().get_ordering(view))
+        self.django_paginator_class = partial(CachedCountPaginator, count_models=self.count_models)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.mode == 'cursor':
+            return Response({
+                'count': cached_count(self.queryset, self.count_models),
+                'next': self.keyset.get_next_link(),
+                'results': data,
+            })
+        return super().get_paginated_response(data)
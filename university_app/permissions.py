@@ -50,3 +50,10 @@ class RoleBasedPermission(permissions.BasePermission):
             return getattr(obj, 'student', None) == request.user.student_profile
 
         return False
+
+
+class IsAdminRole(permissions.BasePermission):
+    """Только пользователи с ролью admin"""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.role == 'admin'
@@ -1,26 +1,50 @@
 # university_app/reports.py — ФИНАЛЬНАЯ РАБОЧАЯ ВЕРСИЯ
-from django.db.models import Avg, Sum, Count, Q, F, Value, DecimalField
+from django.db.models import Avg, Count, F, Q
 from django.db.models.functions import Coalesce
 from django.db import connection
-from .models import Student, Enrollment, Schedule, Payment
+from rest_framework.utils.encoders import JSONEncoder
+import json
+import numpy as np
+import pandas as pd
+from .models import Student, Course, Schedule, CourseGradeStats, StudentDebt
+
+# Гистограмма оценок: корзины по 10 баллов, 100 попадает в последнюю
+HISTOGRAM_BINS = [f"{low}-{low + 9}" for low in range(0, 90, 10)] + ["90-100"]
+PERCENTILES = (25, 50, 75, 90)
+# Строк за один fetch при потоковой выдаче (NDJSON)
+STREAM_CHUNK_SIZE = 2000
 
 
 class UniversityReports:
     """5 сложных отчётов """
 
+    # === ПОТОКОВАЯ ВЫДАЧА ===
+    # Списочные отчёты строятся из *_queryset(): list(...) для обычного ответа,
+    # stream_ndjson(...) — для потока без материализации всего результата
     @staticmethod
-    def students_above_course_average():
-        return list(
+    def stream_ndjson(queryset, chunk_size=STREAM_CHUNK_SIZE):
+        """Строки отчёта по одной JSON-строке; в памяти — не больше chunk_size строк"""
+        for row in queryset.iterator(chunk_size=chunk_size):
+            yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + "\n"
+
+    @staticmethod
+    def students_above_course_average_queryset():
+        return (
             Student.objects.annotate(
                 course_avg_grade=Coalesce(Avg('enrollments__grade'), 0.0)  # ← ВОТ ПРАВИЛЬНОЕ ИМЯ!
             )
             .filter(gpa__gt=F('course_avg_grade'))
+            .order_by('id')
             .values('id', 'full_name', 'email', 'gpa', 'course_avg_grade')
         )
 
     @staticmethod
-    def teacher_week_schedule(teacher_id: int):
-        return list(
+    def students_above_course_average():
+        return list(UniversityReports.students_above_course_average_queryset())
+
+    @staticmethod
+    def teacher_week_schedule_queryset(teacher_id: int):
+        return (
             Schedule.objects.filter(teacher_id=teacher_id)
             .select_related('course')
             .order_by('day_of_week', 'start_time')
@@ -30,22 +54,95 @@ class UniversityReports:
             )
         )
 
+    @staticmethod
+    def teacher_week_schedule(teacher_id: int):
+        return list(UniversityReports.teacher_week_schedule_queryset(teacher_id))
+
     @staticmethod
     def course_average_grade(course_id: int):
-        stats = Enrollment.objects.filter(course_id=course_id).aggregate(
-            avg_grade=Avg('grade'),
-            passed_count=Count('id', filter=Q(passed=True)),
-            total=Count('id')
-        )
-        avg = round(stats['avg_grade'] or 0, 2)
+        # одна строка сводки CourseGradeStats вместо агрегата по всем записям курса
+        stats = CourseGradeStats.objects.filter(course_id=course_id).values('total', 'graded', 'grade_sum', 'passed').first()
+        stats = stats or {'total': 0, 'graded': 0, 'grade_sum': 0, 'passed': 0}
+        avg = round(stats['grade_sum'] / stats['graded'], 2) if stats['graded'] else 0
         return {
             "course_id": course_id,
             "average_grade": avg,
-            "passed_students": stats['passed_count'],
+            "passed_students": stats['passed'],
             "total_students": stats['total'],
-            "success_rate_percent": round((stats['passed_count'] / stats['total'] * 100) if stats['total'] else 0, 2)
+            "success_rate_percent": round((stats['passed'] / stats['total'] * 100) if stats['total'] else 0, 2)
         }
 
+    @staticmethod
+    def course_statistics(course_ids=None, teacher_id=None):
+        """
+        Статистика по всем курсам (или по списку / по преподавателю) одним запросом:
+        GROUP BY (курс, оценка) — не больше ~100 строк на курс, дальше гистограммы
+        и перцентили считаются в pandas за один проход.
+        """
+        courses = Course.objects.all()
+        if course_ids is not None:
+            courses = courses.filter(id__in=course_ids)
+        if teacher_id is not None:
+            courses = courses.filter(teacher_id=teacher_id)
+        rows = list(
+            courses.values('id', 'name', grade=F('enrollments__grade'))
+            .annotate(n=Count('enrollments'), passed=Count('enrollments', filter=Q(enrollments__passed=True)))
+            .order_by('id')
+        )
+        if not rows:
+            return []
+
+        df = pd.DataFrame(rows)
+        totals = df.groupby('id', sort=True).agg(name=('name', 'first'), total=('n', 'sum'), passed=('passed', 'sum'))
+
+        graded = df[df['grade'].notna() & (df['n'] > 0)].astype({'grade': int})
+        sums = (graded['grade'] * graded['n']).groupby(graded['id']).sum()
+        counts = graded.groupby('id')['n'].sum()
+        averages = (sums / counts).round(2).reindex(totals.index, fill_value=0)
+
+        buckets = np.minimum(graded['grade'] // 10, len(HISTOGRAM_BINS) - 1)
+        histograms = (
+            graded.assign(bucket=buckets).pivot_table(index='id', columns='bucket', values='n', aggfunc='sum', fill_value=0)
+            .reindex(index=totals.index, columns=range(len(HISTOGRAM_BINS)), fill_value=0)
+        )
+        quantiles = [p / 100 for p in PERCENTILES]
+        percentiles = {
+            course_id: UniversityReports.weighted_percentiles(group['grade'].to_numpy(), group['n'].to_numpy(), quantiles)
+            for course_id, group in graded.sort_values(['id', 'grade']).groupby('id')
+        }
+
+        result = []
+        for course_id, row in totals.iterrows():
+            total, passed = int(row['total']), int(row['passed'])
+            course_percentiles = percentiles.get(course_id)
+            result.append({
+                "course_id": int(course_id),
+                "course_name": row['name'],
+                "average_grade": float(averages[course_id]),
+                "passed_students": passed,
+                "total_students": total,
+                "success_rate_percent": round(passed / total * 100 if total else 0, 2),
+                "histogram": dict(zip(HISTOGRAM_BINS, map(int, histograms.loc[course_id]))),
+                "percentiles": {
+                    f"p{p}": round(float(course_percentiles[i]), 2) if course_percentiles is not None else None
+                    for i, p in enumerate(PERCENTILES)
+                },
+            })
+        return result
+
+    @staticmethod
+    def weighted_percentiles(grades, counts, quantiles):
+        """
+        Перцентили с линейной интерполяцией (как pandas quantile) по строкам (оценка по возрастанию, сколько раз):
+        i-е значение развёрнутого ряда находится по накопленным счётчикам, сам ряд не строится.
+        """
+        cumulative = np.cumsum(counts)
+        positions = (cumulative[-1] - 1) * np.asarray(quantiles)
+        lower = np.floor(positions)
+        lower_values = grades[np.searchsorted(cumulative, lower, side='right')]
+        upper_values = grades[np.searchsorted(cumulative, np.minimum(lower + 1, cumulative[-1] - 1), side='right')]
+        return lower_values + (positions - lower) * (upper_values - lower_values)
+
     @staticmethod
     def top_5_students_by_gpa():
         with connection.cursor() as cursor:
@@ -61,16 +158,15 @@ class UniversityReports:
             return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
     @staticmethod
-    def debtors_with_debt_amount():
-        return list(
-            Student.objects.annotate(
-                debt=Coalesce(
-                    Sum('payments__amount', filter=Q(payments__status__in=['pending', 'overdue'])),
-                    Value(0),
-                    output_field=DecimalField(max_digits=12, decimal_places=2)
-                )
-            )
-            .filter(debt__gt=0)
-            .order_by('-debt')
+    def debtors_with_debt_amount_queryset():
+        # сводка StudentDebt по индексу debt — без суммирования платежей
+        return (
+            StudentDebt.objects.filter(debt__gt=0)
+            .annotate(id=F('student_id'), full_name=F('student__full_name'), email=F('student__email'))
+            .order_by('-debt', 'student_id')
             .values('id', 'full_name', 'email', 'debt')
         )
+
+    @staticmethod
+    def debtors_with_debt_amount():
+        return list(UniversityReports.debtors_with_debt_amount_queryset())
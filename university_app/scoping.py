@@ -0,0 +1,59 @@
+# university_app/scoping.py — видимость записей по ролям: таблица политик поверх queryset'а вьюсета
+from django.db.models import Exists, OuterRef, Q
+from .cache import UniversityCache
+from .models import Course, Enrollment, Exam, Payment, Schedule, Student
+
+# Роль → атрибут пользователя с id профиля
+PROFILE_ATTRS = {
+    'teacher': 'teacher_profile_id',
+    'student': 'student_profile_id',
+}
+
+
+def teacher_courses(teacher_id):
+    return UniversityCache.get_teacher_scope(teacher_id)['course_ids']
+
+
+def student_courses(student_id):
+    return UniversityCache.get_student_scope(student_id)['course_ids']
+
+
+# (роль, модель) → функция(id профиля) → условие для filter().
+# Курсы профиля — короткий закэшированный список (UniversityCache.get_*_scope): по нему — IN.
+# Студенты преподавателя — неограниченное множество: коррелированный EXISTS по его курсам,
+# без JOIN'а, размножающего строки, и без DISTINCT. Модели, которых нет в таблице, для роли не видны.
+SCOPE_POLICIES = {
+    'teacher': {
+        Course: lambda teacher_id: Q(teacher_id=teacher_id),
+        Schedule: lambda teacher_id: Q(teacher_id=teacher_id),
+        Enrollment: lambda teacher_id: Q(course_id__in=teacher_courses(teacher_id)),
+        Student: lambda teacher_id: Exists(
+            Enrollment.objects.filter(student_id=OuterRef('pk'), course_id__in=teacher_courses(teacher_id))
+        ),
+    },
+    'student': {
+        Enrollment: lambda student_id: Q(student_id=student_id),
+        Payment: lambda student_id: Q(student_id=student_id),
+        Course: lambda student_id: Q(id__in=student_courses(student_id)),
+        Exam: lambda student_id: Q(course_id__in=student_courses(student_id)),
+        Schedule: lambda student_id: Q(course_id__in=student_courses(student_id)),
+    },
+}
+
+# Таблицы, от которых зависит область видимости роли (для ETag'ов, см. conditional.py)
+SCOPE_MODELS = {
+    'teacher': (Course, Enrollment),
+    'student': (Enrollment,),
+}
+
+
+def scope_queryset(queryset, user):
+    """queryset вьюсета (со своими select_related), урезанный до видимого пользователю"""
+    if user.role == 'admin':
+        return queryset.all()
+    policies = SCOPE_POLICIES.get(user.role, {})
+    profile_id = getattr(user, PROFILE_ATTRS.get(user.role, ''), None)
+    policy = policies.get(queryset.model)
+    if policy is None or profile_id is None:
+        return queryset.none()
+    return queryset.filter(policy(profile_id))
@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from .models import (
     Department, Teacher, Student, Course,
-    Enrollment, Schedule, Exam, Payment
+    Enrollment, Schedule, Exam, Payment, AuditLog, ReportJob
 )
 
 
@@ -70,3 +71,25 @@ class PaymentSerializer(serializers.ModelSerializer):
         model = Payment
         fields = '__all__'
         read_only_fields = ['date_created', 'date_paid']
+
+
+class AuditLogSerializer(serializers.ModelSerializer):
+    user_name = serializers.CharField(source='user.username', read_only=True, allow_null=True)
+
+    class Meta:
+        model = AuditLog
+        fields = ['id', 'timestamp', 'user', 'user_name', 'action', 'model_name', 'object_id', 'object_repr', 'changes']
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = ['id', 'report', 'params', 'status', 'error', 'created_at', 'finished_at', 'expires_at', 'result_url']
+        read_only_fields = ['id', 'status', 'error', 'created_at', 'finished_at', 'expires_at']
+
+    def get_result_url(self, obj):
+        if obj.status != 'done':
+            return None
+        return reverse('reportjob-result', args=[obj.pk], request=self.context.get('request'))
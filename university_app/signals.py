@@ -1,75 +1,98 @@
 from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from django.contrib.contenttypes.models import ContentType
-from .models import AuditLog
+from .models import (
+    User, Department, Teacher, Student, Course,
+    Enrollment, Schedule, Exam, ExamResult, Payment, AuditLog
+)
+from . import audit
 
 
-@receiver(post_save)
-def log_save(sender, instance, created, **kwargs):
-    if getattr(sender, '_meta', None) is None:
-        return
-    if sender._meta.app_label in ['admin', 'auth', 'contenttypes', 'sessions', 'django_celery_beat']:
-        return
-    if sender == AuditLog:
-        return
-
-    if hasattr(sender, '_meta') and sender._meta.db_table == 'django_migrations':
-        return
+# === РЕЕСТР АУДИТА ===
+# Аудируются только зарегистрированные модели. repr строится из уже загруженных
+# атрибутов: связанные объекты берутся только если они в кэше (select_related), без ленивых SELECT'ов
+audit.register(User, exclude=['password', 'last_login'])
+audit.register(Department)
+audit.register(Teacher)
+audit.register(Student)
+audit.register(Course)
+audit.register(
+    Enrollment, fields=['grade', 'passed'],
+    repr=lambda e: f"{audit.related_repr(e, 'student')} → {audit.related_repr(e, 'course')}"
+)
+audit.register(
+    Schedule,
+    repr=lambda s: f"{audit.related_repr(s, 'course')} – {s.get_day_of_week_display()} {s.start_time}-{s.end_time}"
+)
+audit.register(
+    Exam,
+    repr=lambda e: f"Экзамен по {audit.related_repr(e, 'course')} – {e.date.strftime('%d.%m.%Y %H:%M')}"
+)
+audit.register(
+    ExamResult, fields=['grade', 'attended'],
+    repr=lambda r: f"{audit.related_repr(r, 'exam')} — {audit.related_repr(r, 'student')}"
+)
+audit.register(
+    Payment, fields=['amount', 'status', 'date_paid'],
+    repr=lambda p: f"{audit.related_repr(p, 'student')} – {p.amount} ₽ ({p.get_status_display()})"
+)
 
-    action = 'create' if created else 'update'
-    changes = None
-    user = None
 
+def get_request_user(instance):
     if hasattr(instance, 'request'):
         try:
             if instance.request.user.is_authenticated:
-                user = instance.request.user
+                return instance.request.user
         except:
             pass
+    return None
+
+
+def log_save(sender, instance, created, **kwargs):
+    config = audit.get_config(sender)
+    if config is None:
+        return
 
-    if not created and hasattr(instance, '_audit_old_state'):
-        old = instance._audit_old_state
+    action = 'create' if created else 'update'
+    changes = None
+
+    # Исходные значения сняты в from_db (TrackedFieldsMixin) — diff без повторного SELECT
+    loaded = getattr(instance, '_loaded_values', None)
+    if not created and loaded is not None:
         changes = {}
-        for field in instance._meta.fields:
-            if field.name in ['password', 'last_login']:
+        # Сравниваем attname (course_id, а не course), чтобы не подгружать связанные объекты
+        for field in config.fields:
+            if field.attname not in loaded or field.attname not in instance.__dict__:
                 continue
-            old_val = getattr(old, field.name, None)
-            new_val = getattr(instance, field.name, None)
+            old_val = loaded[field.attname]
+            new_val = instance.__dict__[field.attname]
             if str(old_val) != str(new_val):
                 changes[field.verbose_name or field.name] = {
                     'old': str(old_val) if old_val is not None else None,
                     'new': str(new_val) if new_val is not None else None
                 }
 
-    AuditLog.objects.create(
-        user=user,
+    audit.record(AuditLog(
+        user=get_request_user(instance),
         action=action,
         model_name=sender._meta.verbose_name,
         object_id=getattr(instance, 'pk', None),
-        object_repr=str(instance)[:200],
+        object_repr=audit.object_repr(instance),
         changes=changes
-    )
+    ), using=kwargs.get('using'))
 
 
-@receiver(post_delete)
 def log_delete(sender, instance, **kwargs):
-    if sender == AuditLog or sender._meta.app_label in ['admin', 'auth', 'contenttypes', 'sessions']:
+    if audit.get_config(sender) is None:
         return
-    if hasattr(sender, '_meta') and sender._meta.db_table == 'django_migrations':
-        return
-
-    user = None
-    if hasattr(instance, 'request'):
-        try:
-            if instance.request.user.is_authenticated:
-                user = instance.request.user
-        except:
-            pass
 
-    AuditLog.objects.create(
-        user=user,
+    audit.record(AuditLog(
+        user=get_request_user(instance),
         action='delete',
         model_name=sender._meta.verbose_name,
         object_id=getattr(instance, 'pk', None),
-        object_repr=str(instance)[:200]
-    )
+        object_repr=audit.object_repr(instance)
+    ), using=kwargs.get('using'))
+
+
+for model in audit.registered_models():
+    post_save.connect(log_save, sender=model, dispatch_uid=f'audit_save_{model._meta.label}')
+    post_delete.connect(log_delete, sender=model, dispatch_uid=f'audit_delete_{model._meta.label}')
@@ -0,0 +1,90 @@
+# university_app/sparse.py — ?fields=: урезание и сериализатора, и SELECT'а
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+
+def resolve_source(model, field):
+    """
+    Поле сериализатора → (путь для .only()/.values(), связи по пути: ['course', 'course__teacher']).
+    None — если поле нельзя свести к колонке модели (метод, свойство, обратная связь, source='*').
+    """
+    source = field.source
+    if source == '*' or not source:
+        return None
+    current, prefix, relations = model, [], []
+    parts = source.split('.')
+    for position, part in enumerate(parts):
+        try:
+            model_field = current._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if model_field.many_to_many or model_field.one_to_many:
+            return None
+        if model_field.is_relation and position < len(parts) - 1:
+            prefix.append(part)
+            relations.append('__'.join(prefix))
+            current = model_field.related_model
+            continue
+        return '__'.join([*prefix, model_field.name]), relations
+    return None
+
+
+def get_model_paths(model, serializer_fields):
+    """Поля сериализатора → (пути для .only(), нужные select_related) или None"""
+    paths, relations = set(), set()
+    for field in serializer_fields:
+        resolved = resolve_source(model, field)
+        if resolved is None:
+            return None
+        paths.add(resolved[0])
+        if resolved[1]:
+            relations.add(resolved[1][-1])
+    return paths, relations
+
+
+class SparseFieldsMixin:
+    """
+    ?fields=id,name,teacher_name для GET-запросов вьюсета:
+    - из сериализатора убираются остальные поля;
+    - queryset получает .only() нужных колонок и только те select_related, которые им нужны.
+    Без параметра (и для записи) поведение не меняется.
+    """
+
+    fields_query_param = 'fields'
+
+    def get_sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = None
+            raw = self.request.query_params.get(self.fields_query_param) if self.request.method == 'GET' else None
+            if raw:
+                names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+                available = self._sparse_available = self.get_serializer_class()(context=self.get_serializer_context()).fields
+                unknown = [name for name in names if name not in available]
+                if unknown:
+                    raise ValidationError({self.fields_query_param: f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(available)}"})
+                self._sparse_fields = names
+        return self._sparse_fields
+
+    def filter_queryset(self, queryset):
+        # filter_queryset, а не get_queryset: его вызывают и list, и get_object, даже если вьюсет переопределил get_queryset
+        queryset = super().filter_queryset(queryset)
+        names = self.get_sparse_fields()
+        if not names:
+            return queryset
+        resolved = get_model_paths(queryset.model, [self._sparse_available[name] for name in names])
+        if resolved is None:
+            return queryset
+        paths, relations = resolved
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*paths)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        names = self.get_sparse_fields()
+        if names:
+            target = getattr(serializer, 'child', serializer)
+            for name in [name for name in target.fields if name not in names]:
+                target.fields.pop(name)
+        return serializer
@@ -0,0 +1,172 @@
+# university_app/stats.py — инкрементальное обновление сводных таблиц CourseGradeStats и StudentDebt
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete
+from .models import Enrollment, Payment, CourseGradeStats, StudentDebt
+
+DEBT_STATUSES = ('pending', 'overdue')
+
+
+class UniversityStats:
+    """
+    Сводные таблицы для отчётов:
+    - CourseGradeStats — записей / с оценкой / сумма оценок / зачтено по курсу
+    - StudentDebt — сумма неоплаченных (pending, overdue) платежей студента
+    Новая запись прибавляет свой вклад одним UPDATE ... SET x = x + d. Изменение и удаление
+    пересчитывают затронутую строку сводки агрегатом под её блокировкой: старое состояние
+    из памяти (_loaded_values) у двух параллельных save одинаковое, и дельты от него разъехались бы.
+    """
+
+    # === ВКЛАД ОДНОЙ СТРОКИ ===
+    @staticmethod
+    def enrollment_contribution(values):
+        grade = values['grade']
+        return {
+            'total': 1,
+            'graded': int(grade is not None),
+            'grade_sum': grade or 0,
+            'passed': int(bool(values['passed'])),
+        }
+
+    @staticmethod
+    def payment_contribution(values):
+        return {'debt': values['amount'] if values['status'] in DEBT_STATUSES else 0}
+
+    @staticmethod
+    def _values(instance, attnames, loaded=False):
+        """Нужные поля из _loaded_values (loaded=True) или из текущих атрибутов; None — если чего-то нет"""
+        source = instance.get_loaded_values() if loaded else instance.__dict__
+        if source is None or any(name not in source for name in attnames):
+            return None
+        return {name: source[name] for name in attnames}
+
+    # === ПРИМЕНЕНИЕ ИЗМЕНЕНИЙ ===
+    @staticmethod
+    def apply(model, key_field, key, delta):
+        """Прибавление вклада новой записи; строки сводки нет — пересчитываем её (в пересчёт уже входит новая запись)"""
+        changes = {name: F(name) + value for name, value in delta.items() if value}
+        if not changes:
+            return
+        updated = model.objects.filter(**{key_field: key}).update(**changes)
+        if not updated:
+            UniversityStats.recompute(model, key)
+
+    @staticmethod
+    def recompute(model, key):
+        """
+        Пересчёт одной строки сводки агрегатом под SELECT ... FOR UPDATE этой строки:
+        параллельные изменения одного курса/студента идут по очереди, и агрегат каждого
+        видит уже закоммиченные изменения соседей.
+        """
+        key_field = model._meta.pk.attname
+        locked = model.objects.select_for_update().filter(pk=key).values_list('pk', flat=True)
+        # savepoint=False: внутри транзакции save() — без лишних SAVEPOINT, снаружи — своя транзакция
+        with transaction.atomic(savepoint=False):
+            if not list(locked):
+                # строки ещё нет — вставляем пустую (параллельная вставка того же ключа дождётся нашей)
+                model.objects.bulk_create([model(**{key_field: key})], ignore_conflicts=True)
+                list(locked.all())
+            rows = UniversityStats.course_rows([key]) if model is CourseGradeStats else UniversityStats.debt_rows([key])
+            row = next(iter(rows), None) or model(**{key_field: key})
+            model.objects.filter(pk=key).update(**{
+                f.attname: getattr(row, f.attname) for f in model._meta.concrete_fields if not f.primary_key
+            })
+
+    @staticmethod
+    def on_change(instance, model, key_attname, fields, contribution, created=False, deleted=False):
+        attnames = [key_attname, *fields]
+        new = None if deleted else UniversityStats._values(instance, attnames)
+        if created and new is not None:
+            # вклад новой записи не зависит от состояния в памяти — атомарный UPDATE через F()
+            if new[key_attname] is not None:
+                UniversityStats.apply(model, key_attname, new[key_attname], contribution(new))
+            return
+
+        old = UniversityStats._values(instance, attnames, loaded=True)
+        if deleted and old is None:
+            old = UniversityStats._values(instance, attnames)
+        if old is not None and new is not None and old[key_attname] == new[key_attname] \
+                and contribution(old) == contribution(new):
+            return  # вклад в сводку не изменился
+        # ключ мог смениться — пересчитываем и старую, и новую строку (по порядку ключей, без взаимных блокировок)
+        keys = {old[key_attname] if old else None, new[key_attname] if new else instance.__dict__.get(key_attname)}
+        for key in sorted(key for key in keys if key is not None):
+            UniversityStats.recompute(model, key)
+
+    # === ПОЛНЫЙ ПЕРЕСЧЁТ ===
+    @staticmethod
+    def course_rows(course_ids=None):
+        queryset = Enrollment.objects.all()
+        if course_ids is not None:
+            queryset = queryset.filter(course_id__in=course_ids)
+        for row in queryset.values('course_id').annotate(
+            total=Count('id'),
+            graded=Count('grade'),
+            grade_sum=Coalesce(Sum('grade'), 0),
+            passed=Count('id', filter=Q(passed=True)),
+        ).order_by():
+            yield CourseGradeStats(**row)
+
+    @staticmethod
+    def debt_rows(student_ids=None):
+        queryset = Payment.objects.filter(status__in=DEBT_STATUSES)
+        if student_ids is not None:
+            queryset = queryset.filter(student_id__in=student_ids)
+        for row in queryset.values('student_id').annotate(
+            debt=Coalesce(Sum('amount'), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2))
+        ).order_by():
+            yield StudentDebt(**row)
+
+    @staticmethod
+    def rebuild_rows(model, keys=None):
+        """Пересчёт сводки целиком (keys=None) или только для указанных курсов/студентов"""
+        if model is CourseGradeStats:
+            key_field, rows = 'course_id', UniversityStats.course_rows(keys)
+        else:
+            key_field, rows = 'student_id', UniversityStats.debt_rows(keys)
+        update_fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+        with transaction.atomic():
+            queryset = model.objects.all() if keys is None else model.objects.filter(**{f'{key_field}__in': keys})
+            queryset.delete()
+            rows = list(rows)
+            # upsert: параллельный save мог уже создать ту же строку
+            model.objects.bulk_create(
+                rows, batch_size=1000, update_conflicts=True,
+                unique_fields=[model._meta.pk.name], update_fields=update_fields,
+            )
+        return len(rows)
+
+    @staticmethod
+    def rebuild():
+        """Полный пересчёт обеих сводок: {'courses': строк, 'debts': строк}"""
+        return {
+            'courses': UniversityStats.rebuild_rows(CourseGradeStats),
+            'debts': UniversityStats.rebuild_rows(StudentDebt),
+        }
+
+
+# === ОБНОВЛЕНИЕ ПО СИГНАЛАМ ===
+TRACKED = {
+    Enrollment: (CourseGradeStats, 'course_id', ['grade', 'passed'], UniversityStats.enrollment_contribution),
+    Payment: (StudentDebt, 'student_id', ['amount', 'status'], UniversityStats.payment_contribution),
+}
+
+
+def stats_on_save(sender, instance, created, **kwargs):
+    UniversityStats.on_change(instance, *TRACKED[sender], created=created)
+
+
+def stats_on_delete(sender, instance, origin=None, **kwargs):
+    model = TRACKED[sender][0]
+    # удаление каскадом от курса/студента: строку сводки Django уже удалил, и её родитель
+    # удаляется следом — пересчёт вставил бы строку, ссылающуюся на удаляемую запись
+    parent = model._meta.pk.related_model
+    if isinstance(origin, parent) or getattr(origin, 'model', None) is parent:
+        return
+    UniversityStats.on_change(instance, *TRACKED[sender], deleted=True)
+
+
+for _model in TRACKED:
+    post_save.connect(stats_on_save, sender=_model, dispatch_uid=f'stats_save_{_model._meta.label}')
+    post_delete.connect(stats_on_delete, sender=_model, dispatch_uid=f'stats_delete_{_model._meta.label}')
@@ -62,18 +62,17 @@ def generate_performance_report(student_id):
     return f"Отчёт сохранён: {filepath}"
 
 
-import pandas as pd
-from celery import shared_task
-from django.db import transaction
-from .models import Student
+from celery import shared_task, chord
+from .importers import StudentImporter, ImportResult
 import os
+import time
 from django.core.mail import EmailMessage
 from django.conf import settings
 
 
 @shared_task(bind=True)
-def import_students_task(self, file_path, user_email=None):
-    """Асинхронный импорт студентов из CSV/XLSX"""
+def import_students_task(self, file_path, user_email=None, chunk_size=None):
+    """Асинхронный импорт студентов из CSV/XLSX (потоково, коммит на каждый кусок)"""
 
     # Проверяем, существует ли файл
     if not os.path.exists(file_path):
@@ -88,47 +87,10 @@ def import_students_task(self, file_path, user_email=None):
         raise FileNotFoundError(error_msg)
 
     try:
-
-        if file_path.lower().endswith('.csv'):
-            df = pd.read_csv(file_path, encoding='utf-8')
-        else:
-            df = pd.read_excel(file_path, engine='openpyxl')
-
-        created = 0
-        updated = 0
-        errors = []
-
-        with transaction.atomic():
-            for index, row in df.iterrows():
-                try:
-                    email = str(row['email']).strip()
-                    full_name = str(row['full_name']).strip()
-                    gpa = float(row['gpa']) if pd.notna(row.get('gpa')) else 0.0
-                    status = str(row.get('status', 'active')).strip().lower()
-
-                    if status not in ['active', 'academic_leave', 'expelled', 'graduated']:
-                        status = 'active'
-
-                    obj, was_created = Student.objects.update_or_create(
-                        email=email,
-                        defaults={
-                            'full_name': full_name,
-                            'gpa': round(float(gpa), 2),
-                            'status': status
-                        }
-                    )
-                    if was_created:
-                        created += 1
-                    else:
-                        updated += 1
-
-                except Exception as e:
-                    errors.append(f"Строка {index + 2}: {str(e)}")
+        result = StudentImporter(chunk_size=chunk_size).import_file(file_path)
 
         # Отчёт
-        report = f"Импорт завершён!\nСоздано: {created}\nОбновлено: {updated}\nОшибок: {len(errors)}"
-        if errors:
-            report += "\n\nОшибки:\n" + "\n".join(errors[:20])
+        report = result.summary()
 
         if user_email:
             EmailMessage(
@@ -150,3 +112,122 @@ def import_students_task(self, file_path, user_email=None):
                 to=[user_email]
             ).send(fail_silently=True)
         raise
+
+
+@shared_task(bind=True)
+def import_students_sharded_task(self, file_path, user_email=None, shards=4, chunk_size=None):
+    """Параллельный импорт: файл режется на диапазоны строк, шарды идут группой, отчёт собирает chord"""
+    if not os.path.exists(file_path):
+        error_msg = f"Файл не найден по пути: {file_path}"
+        if user_email:
+            EmailMessage(
+                subject='Ошибка импорта студентов',
+                body=error_msg,
+                from_email='no-reply@university.ru',
+                to=[user_email]
+            ).send(fail_silently=True)
+        raise FileNotFoundError(error_msg)
+
+    plan = StudentImporter.plan_shards(file_path, shards)
+    header = [
+        import_students_shard_task.s(file_path, number, shard['start_row'], shard['end_row'],
+                                     shard['skip_rows'], chunk_size)
+        for number, shard in enumerate(plan, start=1)
+    ]
+    return chord(header)(merge_import_results.s(user_email)).id
+
+
+@shared_task
+def import_students_shard_task(file_path, shard, start_row, end_row, skip_rows=None, chunk_size=None):
+    """Импорт одного диапазона строк [start_row, end_row)"""
+    started = time.monotonic()
+    importer = StudentImporter(chunk_size=chunk_size, skip_rows={line: first for line, first in skip_rows or []})
+    result = importer.import_file(file_path, start_row, end_row)
+    return {
+        **result.as_dict(),
+        'shard': shard,
+        'start_row': start_row,
+        'end_row': end_row,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+@shared_task
+def merge_import_results(shard_results, user_email=None):
+    """Сводный отчёт по всем шардам + время каждого шарда"""
+    shard_results = sorted(shard_results, key=lambda r: r['shard'])
+    total = ImportResult()
+    for shard_result in shard_results:
+        total.merge(ImportResult.from_dict(shard_result))
+
+    report = total.summary()
+    report += "\n\nШарды:\n" + "\n".join(
+        f"#{r['shard']} строки {r['start_row']}–{r['end_row'] - 1}: "
+        f"создано {r['created']}, обновлено {r['updated']}, без изменений {r.get('unchanged', 0)}, "
+        f"ошибок {len(r['errors'])} — {r['seconds']} с"
+        for r in shard_results
+    )
+
+    if user_email:
+        EmailMessage(
+            subject='Отчёт по импорту студентов',
+            body=report,
+            from_email='no-reply@university.ru',
+            to=[user_email]
+        ).send(fail_silently=True)
+
+    return report
+
+
+@shared_task
+def write_audit_entries(entries):
+    """Фоновая запись буфера аудита (AUDIT_ASYNC_FLUSH = True)"""
+    from .models import AuditLog
+    AuditLog.objects.bulk_create([AuditLog(**entry) for entry in entries])
+    return len(entries)
+
+
+@shared_task
+def archive_audit_log_task(older_than_days=None):
+    """Периодический перенос старого аудита в архив (см. CELERY_BEAT_SCHEDULE)"""
+    from .archive import AuditArchive
+    manifests = AuditArchive.archive(older_than_days)
+    return f"В архив перенесено {sum(m['count'] for m in manifests)} записей"
+
+
+@shared_task
+def refresh_cache_dataset(name, *args, lock_key=None):
+    """Фоновая пересборка набора данных UniversityCache после soft TTL"""
+    from django.core.cache import cache
+    from .cache import UniversityCache
+    try:
+        UniversityCache.rebuild(name, *args)
+    finally:
+        if lock_key:
+            cache.delete(lock_key)
+    return f"Кэш {name} обновлён"
+
+
+@shared_task
+def warm_cache_task(ahead=None):
+    """Периодический refresh-ahead: пересборка наборов кэша незадолго до soft TTL"""
+    from .cache import UniversityCache
+    ahead = ahead if ahead is not None else settings.CACHE_REFRESH_AHEAD
+    stats = UniversityCache.warm(ahead=ahead)
+    rebuilt = sum(item['rebuilt'] for item in stats.values())
+    return f"Кэш: пересобрано {rebuilt} из {sum(item['entries'] for item in stats.values())}"
+
+
+@shared_task
+def run_report_job(job_id):
+    """Фоновый отчёт из jobs.REPORTS; результат — в MEDIA_ROOT/reports/jobs"""
+    from .jobs import ReportJobs
+    job = ReportJobs.run(job_id)
+    return f"Отчёт {job_id}: {job.status if job else 'пропущен'}"
+
+
+@shared_task
+def purge_report_jobs_task():
+    """Удаление фоновых отчётов с истёкшим TTL"""
+    from .jobs import ReportJobs
+    return f"Удалено фоновых отчётов: {ReportJobs.purge()}"
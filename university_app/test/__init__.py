@@ -0,0 +1,9 @@
+from django.test import override_settings
+
+# Кэш в памяти процесса для тестов, которые чистят кэш: не трогаем Redis/файлы разработчика
+in_memory_cache = override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'university-tests',
+    }
+})
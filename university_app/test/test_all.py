@@ -1,12 +1,33 @@
+import json
 import os
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+from datetime import time, timedelta
+from unittest import mock
+import numpy as np
+import pandas as pd
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from university_app.models import Student, Teacher, Course, Enrollment
+from university_app.models import Department, Student, Teacher, Course, Enrollment, Schedule, Exam, Payment, AuditLog, CourseGradeStats, StudentDebt, ReportJob
 from university_app.tasks import generate_performance_report
 from django.conf import settings
+from django.core.cache import cache
+from university_app.bulk import EnrollmentBulk
+from university_app.test import in_memory_cache
+from university_app.cache import UniversityCache
+from university_app.fastlist import FastListMixin
+from university_app.jobs import ReportJobs
+from university_app.reports import UniversityReports
+from university_app.scoping import scope_queryset
+from university_app.stats import UniversityStats
 
 User = get_user_model()
 
@@ -33,8 +54,13 @@ class BusinessLogicTests(TestCase):
         self.assertTrue(e2.passed)
 
 
+@in_memory_cache
 class APITests(APITestCase):
     def setUp(self):
+        # версии таблиц в кэше поднимаются только на коммите, а TestCase не коммитит
+        cache.clear()
+        UniversityCache.local.clear()
+
         self.admin = User.objects.create_superuser('admin', 'admin@uni.ru', '123')
         self.admin.role = 'admin'
         self.admin.save()
@@ -112,3 +138,486 @@ class CeleryTaskTests(TestCase):
         report_dir = os.path.join(settings.MEDIA_ROOT, 'reports')
         files = os.listdir(report_dir)
         self.assertTrue(any('report' in f for f in files))
+
+
+class SummaryTablesTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(full_name="Сводка", email="sum@uni.ru")
+        self.other = Student.objects.create(full_name="Другой", email="sum2@uni.ru")
+        self.course = Course.objects.create(name="Сводный", credits=3)
+
+    def assertStatsConsistent(self):
+        incremental = {
+            'courses': sorted(CourseGradeStats.objects.values_list('course_id', 'total', 'graded', 'grade_sum', 'passed')),
+            'debts': sorted(StudentDebt.objects.exclude(debt=0).values_list('student_id', 'debt')),
+        }
+        UniversityStats.rebuild()
+        self.assertEqual(incremental, {
+            'courses': sorted(CourseGradeStats.objects.values_list('course_id', 'total', 'graded', 'grade_sum', 'passed')),
+            'debts': sorted(StudentDebt.objects.values_list('student_id', 'debt')),
+        })
+
+    def test_course_stats_follow_enrollment_changes(self):
+        first = Enrollment.objects.create(student=self.student, course=self.course, grade=80)
+        Enrollment.objects.create(student=self.other, course=self.course)
+        enrollment = Enrollment.objects.get(pk=first.pk)
+        enrollment.grade = 40
+        enrollment.save()
+
+        with self.assertNumQueries(1):
+            report = UniversityReports.course_average_grade(self.course.id)
+        self.assertEqual((report['total_students'], report['passed_students'], report['average_grade']), (2, 1, 40))
+        self.assertStatsConsistent()
+
+        Enrollment.objects.filter(pk=first.pk).get().delete()
+        self.assertEqual(UniversityReports.course_average_grade(self.course.id)['total_students'], 1)
+        self.assertStatsConsistent()
+
+    def test_saves_from_same_loaded_state_do_not_drift(self):
+        enrollment = Enrollment.objects.create(student=self.student, course=self.course, grade=50)
+        first, second = Enrollment.objects.get(pk=enrollment.pk), Enrollment.objects.get(pk=enrollment.pk)
+        first.grade = 70
+        first.save()
+        second.grade = 80
+        second.save()
+        # повторное удаление уже удалённой строки тоже шлёт post_delete
+        payment = Payment.objects.create(student=self.student, amount=100, status='pending')
+        stale = Payment.objects.get(pk=payment.pk)
+        payment.delete()
+        stale.delete()
+        self.assertEqual(CourseGradeStats.objects.get(course=self.course).grade_sum, 80)
+        self.assertEqual(StudentDebt.objects.get(student=self.student).debt, 0)
+        self.assertStatsConsistent()
+
+    def test_deleting_parent_cascades_without_reinserting_summary(self):
+        Enrollment.objects.create(student=self.student, course=self.course, grade=90)
+        Enrollment.objects.create(student=self.other, course=self.course, grade=50)
+        Payment.objects.create(student=self.student, amount=100, status='pending')
+        self.course.delete()
+        Student.objects.filter(pk=self.student.pk).delete()  # origin — QuerySet
+        # внешние ключи SQLite проверяет на коммите — проверяем явно
+        connection.check_constraints()
+        self.assertFalse(CourseGradeStats.objects.exists())
+        self.assertFalse(StudentDebt.objects.exists())
+        self.assertStatsConsistent()
+
+    def test_debt_follows_payment_status_and_amount(self):
+        payment = Payment.objects.create(student=self.student, amount=1000, status='pending')
+        Payment.objects.create(student=self.other, amount=300, status='overdue')
+        payment = Payment.objects.get(pk=payment.pk)
+        payment.amount = 1500
+        payment.save()
+        self.assertEqual([(d['id'], d['debt']) for d in UniversityReports.debtors_with_debt_amount()],
+                         [(self.student.id, 1500), (self.other.id, 300)])
+
+        payment.status = 'paid'
+        payment.save()
+        self.assertEqual([d['id'] for d in UniversityReports.debtors_with_debt_amount()], [self.other.id])
+        self.assertStatsConsistent()
+
+
+@in_memory_cache
+class CourseStatisticsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        self.admin = User.objects.create_user('stats-admin', 'stats@uni.ru', '123', role='admin')
+        self.teacher = Teacher.objects.create(full_name="Статистик", email="stat-t@uni.ru")
+        self.course = Course.objects.create(name="Много оценок", credits=3, teacher=self.teacher)
+        self.empty = Course.objects.create(name="Пустой", credits=3)
+        self.ungraded = Course.objects.create(name="Без оценок", credits=3)
+        for i, grade in enumerate([40, 60, 75, 90, 100, None]):
+            student = Student.objects.create(full_name=f"С{i}", email=f"stat{i}@uni.ru")
+            Enrollment.objects.create(student=student, course=self.course, grade=grade)
+        Enrollment.objects.create(student=student, course=self.ungraded)
+
+    def test_batch_statistics_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats = {row['course_id']: row for row in UniversityReports.course_statistics()}
+
+        row = stats[self.course.id]
+        single = UniversityReports.course_average_grade(self.course.id)
+        for key in ('average_grade', 'passed_students', 'total_students', 'success_rate_percent'):
+            self.assertEqual(row[key], single[key])
+        self.assertEqual(row['histogram']['40-49'], 1)
+        self.assertEqual(row['histogram']['90-100'], 2)
+        self.assertEqual(sum(row['histogram'].values()), 5)
+        self.assertEqual(row['percentiles'], {'p25': 60.0, 'p50': 75.0, 'p75': 90.0, 'p90': 96.0})
+
+        self.assertEqual(stats[self.empty.id]['total_students'], 0)
+        self.assertEqual(stats[self.ungraded.id]['total_students'], 1)
+        self.assertIsNone(stats[self.ungraded.id]['percentiles']['p50'])
+
+    def test_endpoint_filters(self):
+        self.client.force_authenticate(user=self.admin)
+        url = reverse('course_statistics')
+        response = self.client.get(url, {'teacher_id': self.teacher.id})
+        self.assertEqual([row['course_id'] for row in response.data['results']], [self.course.id])
+
+        response = self.client.get(url, {'course_ids': f"{self.empty.id},{self.ungraded.id}"})
+        self.assertEqual([row['course_id'] for row in response.data['results']], [self.empty.id, self.ungraded.id])
+        self.assertEqual(self.client.get(url, {'course_ids': 'a,b'}).status_code, 400)
+
+    def test_percentiles_from_cumulative_counts(self):
+        grades, counts = np.array([40, 70, 100]), np.array([1_000_000, 3, 2_000_000])
+        # без разворачивания в 3 млн строк — и так же, как pandas quantile на развёрнутом ряду
+        expected = pd.Series(np.repeat([40, 70, 100], [10, 1, 20])).quantile([0.25, 0.5, 0.9]).tolist()
+        self.assertEqual(UniversityReports.weighted_percentiles(np.array([40, 70, 100]), np.array([10, 1, 20]), [0.25, 0.5, 0.9]).tolist(), expected)
+        self.assertEqual(UniversityReports.weighted_percentiles(grades, counts, [0, 0.3, 0.5, 1]).tolist(), [40, 40, 100, 100])
+
+
+@in_memory_cache
+class StreamingReportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        self.admin = User.objects.create_user('stream-admin', 'stream@uni.ru', '123', role='admin')
+        for i in range(5):
+            student = Student.objects.create(full_name=f"Должник {i}", email=f"debt{i}@uni.ru")
+            Payment.objects.create(student=student, amount=100 * (i + 1), status='pending')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_ndjson_matches_json_report(self):
+        url = reverse('debtors')
+        response = self.client.get(url, {'output': 'ndjson'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], json.loads(self.client.get(url).content)['debtors'])
+        self.assertNotEqual(response['ETag'], self.client.get(url)['ETag'])
+
+    def test_stream_reads_in_chunks(self):
+        queryset = UniversityReports.debtors_with_debt_amount_queryset()
+        stream = UniversityReports.stream_ndjson(queryset, chunk_size=2)
+        first = json.loads(next(stream))
+        self.assertEqual(first['debt'], 500.0)
+        self.assertEqual(len(list(stream)), 4)
+
+
+class ReportJobTests(APITestCase):
+    def setUp(self):
+        self.result_dir = tempfile.mkdtemp()
+        self.override = override_settings(REPORT_JOBS_DIR=self.result_dir)
+        self.override.enable()
+        self.admin = User.objects.create_user('jobs-admin', 'jobs@uni.ru', '123', role='admin')
+        self.teacher_user = User.objects.create_user('jobs-teacher', 'jobs-t@uni.ru', '123', role='teacher')
+        student = Student.objects.create(full_name="Фоновый", email="job@uni.ru")
+        Payment.objects.create(student=student, amount=700, status='overdue')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.result_dir, ignore_errors=True)
+
+    def submit(self, report, params=None, user=None):
+        self.client.force_authenticate(user=user or self.admin)
+        with mock.patch('university_app.tasks.run_report_job.apply_async') as apply_async, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('reportjob-list'), {'report': report, 'params': params or {}}, format='json')
+        return response, apply_async
+
+    def test_submit_run_and_fetch_result(self):
+        response, apply_async = self.submit('debtors')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'pending')
+        job_id = response.data['id']
+        apply_async.assert_called_once_with(args=[job_id], retry=False)
+
+        ReportJobs.run(job_id)
+        response = self.client.get(reverse('reportjob-detail', args=[job_id]))
+        self.assertEqual(response.data['status'], 'done')
+        result = self.client.get(response.data['result_url'])
+        payload = json.loads(b''.join(result.streaming_content))
+        self.assertEqual(payload['data'][0]['debt'], 700.0)
+
+    def test_identical_submissions_are_deduplicated(self):
+        first, _ = self.submit('course_statistics', {'course_ids': [3, 1, 3]})
+        second, apply_async = self.submit('course_statistics', {'course_ids': [1, 3]})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['id'], first.data['id'])
+        apply_async.assert_not_called()
+
+        ReportJobs.run(first.data['id'])
+        self.assertEqual(self.submit('course_statistics', {'course_ids': [1, 3]})[0].data['id'], first.data['id'])
+        self.assertEqual(self.submit('course_statistics', {'course_ids': [2]})[0].status_code, 201)
+
+    def test_access_and_validation(self):
+        self.assertEqual(self.submit('debtors', user=self.teacher_user)[0].status_code, 403)
+        self.assertEqual(self.submit('nope')[0].status_code, 400)
+        self.assertEqual(self.submit('course_average', {'course_id': 'x'})[0].status_code, 400)
+
+    def test_teacher_cannot_read_other_teachers_schedule_job(self):
+        other = Teacher.objects.create(full_name="Другой", email="jobs-other@uni.ru")
+        response, _ = self.submit('teacher_schedule', {'teacher_id': other.id})
+        self.client.force_authenticate(user=self.teacher_user)
+        self.assertEqual(self.client.get(reverse('reportjob-detail', args=[response.data['id']])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('reportjob-result', args=[response.data['id']])).status_code, 403)
+
+    def test_lost_race_with_finished_job_reuses_it(self):
+        now = timezone.now()
+        params_hash = ReportJobs.get_params_hash('top_5_students', {})
+        done = ReportJob.objects.create(report='top_5_students', params={}, params_hash=params_hash, status='done',
+                                        finished_at=now, expires_at=now + timedelta(hours=1))
+        # параллельный заказ создал задачу и успел её выполнить между поиском и INSERT'ом
+        with mock.patch.object(ReportJobs, 'find_reusable', side_effect=[None, done]), \
+                mock.patch.object(ReportJob.objects, 'create', side_effect=IntegrityError):
+            self.assertEqual(ReportJobs.submit('top_5_students', {}), (done, False))
+
+    def test_expired_results_are_purged(self):
+        response, _ = self.submit('top_5_students')
+        job = ReportJobs.run(response.data['id'])
+        path = os.path.join(self.result_dir, job.result_file)
+        self.assertTrue(os.path.exists(path))
+
+        ReportJob.objects.filter(pk=job.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.get(reverse('reportjob-result', args=[job.pk])).status_code, 404)
+        self.assertEqual(ReportJobs.purge(), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ReportJob.objects.exists())
+
+
+@in_memory_cache
+class HybridPaginationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin = User.objects.create_user('page-admin', 'page@uni.ru', '123', role='admin')
+            self.students = [Student.objects.create(full_name=f"Стр {i}", email=f"page{i}@uni.ru") for i in range(5)]
+        self.client.force_authenticate(user=self.admin)
+
+    def test_cursor_mode_walks_pages_with_cached_count(self):
+        url = reverse('student-list')
+        response = self.client.get(url, {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([row['id'] for row in response.data['results']], [s.id for s in self.students[:2]])
+
+        seen = [row['id'] for row in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            # только SELECT страницы: ни COUNT(*), ни OFFSET
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(next_url)
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn('OFFSET', queries[0]['sql'])
+            seen += [row['id'] for row in response.data['results']]
+            next_url = response.data['next']
+        self.assertEqual(seen, [s.id for s in self.students])
+
+    def test_page_mode_is_default(self):
+        url = reverse('student-list')
+        response = self.client.get(url, {'page_size': 2, 'page': 2})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([row['id'] for row in response.data['results']], [s.id for s in self.students[2:4]])
+        self.assertIsNotNone(response.data['previous'])
+        with self.assertNumQueries(1):
+            self.client.get(url, {'page_size': 2, 'page': 3})
+
+    def test_count_cache_follows_table_version(self):
+        url = reverse('student-list')
+        self.assertEqual(self.client.get(url).data['count'], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(full_name="Новый", email="page-new@uni.ru")
+        self.assertEqual(self.client.get(url).data['count'], 6)
+
+    def test_count_cache_follows_scope_tables(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            teacher = Teacher.objects.create(full_name="Счёт", email="page-t@uni.ru")
+            course = Course.objects.create(name="Счёт", credits=3, teacher=teacher)
+            Enrollment.objects.create(student=self.students[0], course=course)
+            teacher_user = User.objects.create_user('page-teacher', 'page-t@uni.ru', '123', role='teacher',
+                                                    teacher_profile=teacher)
+        self.client.force_authenticate(user=teacher_user)
+        url = reverse('student-list')
+        self.assertEqual(self.client.get(url).data['count'], 1)
+        # таблица Student не менялась — меняется только область видимости (Enrollment)
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=self.students[1], course=course)
+        response = self.client.get(url)
+        self.assertEqual((response.data['count'], len(response.data['results'])), (2, 2))
+
+@in_memory_cache
+class SparseFieldsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        self.admin = User.objects.create_user('sparse-admin', 'sparse@uni.ru', '123', role='admin')
+        teacher = Teacher.objects.create(full_name="Узкий", email="sparse-t@uni.ru")
+        self.course = Course.objects.create(name="Узкий курс", credits=4, description="Длинное описание" * 100, teacher=teacher)
+        self.client.force_authenticate(user=self.admin)
+
+    def test_fields_prune_serializer_and_select(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('course-list'), {'fields': 'id,name,teacher_name', 'pagination': 'page'})
+        self.assertEqual(response.data['results'], [{'id': self.course.id, 'name': "Узкий курс", 'teacher_name': "Узкий"}])
+        select = [q['sql'] for q in queries if 'university_app_course' in q['sql'] and 'COUNT' not in q['sql']][0]
+        self.assertNotIn('description', select)
+        self.assertIn('full_name', select)
+
+    def test_unneeded_join_is_dropped(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('course-detail', args=[self.course.id]), {'fields': 'name,credits'})
+        self.assertEqual(response.data, {'name': "Узкий курс", 'credits': 4})
+        self.assertNotIn('JOIN', queries[-1]['sql'])
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('course-list'), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+
+
+@in_memory_cache
+class FastListTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        self.admin = User.objects.create_user('fast-admin', 'fast@uni.ru', '123', role='admin')
+        department = Department.objects.create(name="Быстрая кафедра")
+        teacher = Teacher.objects.create(full_name="Быстров", email="fast-t@uni.ru", department=department, position='professor')
+        Teacher.objects.create(full_name="Без кафедры")
+        student = Student.objects.create(full_name="Скоростной", email="fast-s@uni.ru", gpa=3.75, status='graduated')
+        course = Course.objects.create(name="С преподавателем", credits=5, teacher=teacher)
+        lonely = Course.objects.create(name="Без преподавателя", credits=2, description="—")
+        Enrollment.objects.create(student=student, course=course, grade=91)
+        Enrollment.objects.create(student=student, course=lonely)
+        Schedule.objects.create(course=course, teacher=teacher, room="101", day_of_week='friday',
+                                start_time=time(9, 30), end_time=time(11, 0))
+        Exam.objects.create(course=course, date=timezone.now())
+        Payment.objects.create(student=student, amount=1234.5, status='overdue')
+        self.client.force_authenticate(user=self.admin)
+
+    def test_output_is_byte_identical_to_serializers(self):
+        for name in ['department', 'teacher', 'student', 'course', 'enrollment', 'schedule', 'exam', 'payment', 'auditlog']:
+            for params in ({}, {'pagination': 'page'}, {'fields': 'id'}):
+                url = reverse(f'{name}-list')
+                fast = self.client.get(url, params).content
+                with mock.patch.object(FastListMixin, 'fast_list', False):
+                    slow = self.client.get(url, params).content
+                self.assertEqual(fast, slow, f"{name} {params}")
+
+    def test_fast_path_skips_model_instances(self):
+        with mock.patch.object(Enrollment, 'from_db', side_effect=AssertionError("модель не должна создаваться")):
+            response = self.client.get(reverse('enrollment-list'))
+        self.assertEqual({row['course_name'] for row in response.data['results']}, {"С преподавателем", "Без преподавателя"})
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_lists', iterations=1, only=['enrollments', 'schedules'], stdout=out)
+        self.assertEqual(out.getvalue().count("идентичен"), 2)
+
+
+@in_memory_cache
+class BulkEnrollmentTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        self.teacher = Teacher.objects.create(full_name="Массовый", email="bulk-t@uni.ru")
+        self.teacher_user = User.objects.create_user('bulk-teacher', 'bulk-t@uni.ru', '123', role='teacher')
+        self.teacher_user.teacher_profile = self.teacher
+        self.teacher_user.save()
+        self.course = Course.objects.create(name="Свой", credits=3, teacher=self.teacher)
+        self.foreign = Course.objects.create(name="Чужой", credits=3)
+        self.students = [Student.objects.create(full_name=f"Б{i}", email=f"bulk{i}@uni.ru") for i in range(3)]
+        self.url = reverse('enrollment-bulk')
+        self.client.force_authenticate(user=self.teacher_user)
+
+    def test_bulk_create_and_grades(self):
+        rows = [{'student': s.id, 'course': self.course.id, 'grade': g} for s, g in zip(self.students, [59, 60, None])]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(Enrollment.objects.filter(course=self.course).order_by('student_id').values_list('grade', 'passed')),
+            [(59, False), (60, True), (None, False)],
+        )
+        self.assertEqual(AuditLog.objects.filter(action='create', model_name='Запись на курс').count(), 3)
+
+        ids = response.data['ids']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, [{'id': ids[0], 'grade': 95}, {'id': ids[1], 'grade': 60}], format='json')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertTrue(Enrollment.objects.get(id=ids[0]).passed)
+        entry = AuditLog.objects.get(action='update', object_id=ids[0])
+        self.assertEqual(entry.changes['Оценка (0-100)'], {'old': '59', 'new': '95'})
+        self.assertEqual(entry.user, self.teacher_user)
+
+        stats = CourseGradeStats.objects.get(course=self.course)
+        self.assertEqual((stats.total, stats.graded, stats.grade_sum, stats.passed), (3, 2, 155, 2))
+
+    def test_validation_is_all_or_nothing(self):
+        rows = [
+            {'student': self.students[0].id, 'course': self.course.id},
+            {'student': self.students[0].id, 'course': self.course.id},
+            {'student': 999999, 'course': self.course.id, 'grade': 101},
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['errors']), {1, 2})
+        self.assertFalse(Enrollment.objects.exists())
+
+    def test_one_permission_check_per_course(self):
+        rows = [{'student': s.id, 'course': self.foreign.id} for s in self.students]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Enrollment.objects.exists())
+
+    def test_concurrent_enrollment_is_400(self):
+        rows = [{'student': s.id, 'course': self.course.id} for s in self.students]
+        original = EnrollmentBulk.check_existing
+
+        def race(*args):
+            # параллельный запрос записал студента между проверкой и вставкой
+            original(*args)
+            Enrollment.objects.create(student=self.students[1], course=self.course)
+
+        with mock.patch.object(EnrollmentBulk, 'check_existing', side_effect=race):
+            response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data)
+
+
+@in_memory_cache
+class RoleScopingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        self.teacher = Teacher.objects.create(full_name="Свой", email="scope-t@uni.ru")
+        other_teacher = Teacher.objects.create(full_name="Чужой", email="scope-o@uni.ru")
+        self.student = Student.objects.create(full_name="Видимый", email="scope-s@uni.ru")
+        self.stranger = Student.objects.create(full_name="Невидимый", email="scope-x@uni.ru")
+        self.course = Course.objects.create(name="Свой курс", credits=3, teacher=self.teacher)
+        self.course2 = Course.objects.create(name="Второй свой", credits=3, teacher=self.teacher)
+        self.foreign = Course.objects.create(name="Чужой курс", credits=3, teacher=other_teacher)
+        # студент записан на оба курса преподавателя — JOIN дал бы его дважды
+        Enrollment.objects.create(student=self.student, course=self.course)
+        Enrollment.objects.create(student=self.student, course=self.course2)
+        Enrollment.objects.create(student=self.stranger, course=self.foreign)
+        Exam.objects.create(course=self.course, date=timezone.now())
+        Exam.objects.create(course=self.foreign, date=timezone.now())
+
+        self.teacher_user = User.objects.create_user('scope-teacher', 'scope-t@uni.ru', '123', role='teacher',
+                                                     teacher_profile=self.teacher)
+        self.student_user = User.objects.create_user('scope-student', 'scope-s@uni.ru', '123', role='student',
+                                                     student_profile=self.student)
+
+    def test_exists_keeps_select_related_without_distinct(self):
+        # студенты преподавателя — EXISTS по его курсам: студент на двух курсах не задваивается
+        students = scope_queryset(Student.objects.all(), self.teacher_user)
+        sql = str(students.query).upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertEqual(list(students), [self.student])
+
+        # фильтр ложится поверх queryset'а вьюсета: select_related сохраняются
+        queryset = scope_queryset(Enrollment.objects.select_related('student', 'course__teacher'), self.teacher_user)
+        with self.assertNumQueries(1):
+            rows = [(e.student.full_name, e.course.teacher.full_name) for e in queryset]
+        self.assertEqual(sorted(rows), [("Видимый", "Свой"), ("Видимый", "Свой")])
+
+    def test_teacher_and_student_visibility(self):
+        students = scope_queryset(Student.objects.all(), self.teacher_user)
+        self.assertEqual(list(students), [self.student])
+        self.assertEqual(set(scope_queryset(Course.objects.all(), self.student_user)), {self.course, self.course2})
+        self.assertEqual(scope_queryset(Exam.objects.all(), self.student_user).get().course, self.course)
+        self.assertFalse(scope_queryset(Payment.objects.all(), self.teacher_user).exists())
+
+        self.teacher_user.teacher_profile = None
+        self.assertFalse(scope_queryset(Course.objects.all(), self.teacher_user).exists())
@@ -0,0 +1,220 @@
+import gzip
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.contrib.sessions.models import Session
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from university_app import audit
+from university_app.archive import AuditArchive
+from university_app.models import User, Student, Course, Enrollment, AuditLog
+
+
+class AuditBufferTests(TestCase):
+    def test_entries_flushed_once_on_commit(self):
+        # TestCase уже внутри транзакции — все записи копятся в одном буфере
+        with self.captureOnCommitCallbacks() as callbacks:
+            student = Student.objects.create(full_name="Буфер", email="buf@uni.ru")
+            student.full_name = "Буфер 2"
+            student.save()
+            student.delete()
+        self.assertEqual(AuditLog.objects.count(), 0)
+        buffers = [callback for callback in callbacks if isinstance(callback, audit.AuditBuffer)]
+        self.assertEqual(len(buffers), 1)
+
+        with self.assertNumQueries(1):
+            buffers[0]()
+        self.assertEqual(
+            list(AuditLog.objects.order_by('id').values_list('action', flat=True)),
+            ['create', 'update', 'delete']
+        )
+
+    def test_rolled_back_savepoint_drops_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(full_name="Остаётся", email="keep@uni.ru")
+            try:
+                with transaction.atomic():
+                    Student.objects.create(full_name="Откат", email="rollback@uni.ru")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(list(AuditLog.objects.values_list('object_repr', flat=True)), ['Остаётся (GPA: 0.0)'])
+
+    def test_many_savepoints_keep_entries_of_surviving_levels(self):
+        # как построчный повтор импорта: по savepoint'у на строку, часть строк откатывается
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(200):
+                try:
+                    with transaction.atomic():
+                        Student.objects.create(full_name=f"Строка {i}", email=f"row{i}@uni.ru")
+                        if i % 50 == 0:
+                            raise RuntimeError
+                except RuntimeError:
+                    pass
+            Student.objects.create(full_name="Снаружи", email="outer@uni.ru")
+        self.assertEqual(AuditLog.objects.filter(action='create').count(), 200 - 4 + 1)
+        self.assertFalse(AuditLog.objects.filter(object_repr__startswith="Строка 50 ").exists())
+
+    @override_settings(AUDIT_ASYNC_FLUSH=True)
+    def test_async_flush_goes_to_celery(self):
+        with mock.patch('university_app.tasks.write_audit_entries.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                Student.objects.create(full_name="Фон", email="bg@uni.ru")
+        self.assertEqual(AuditLog.objects.count(), 0)
+        entries = apply_async.call_args.kwargs['args'][0]
+        self.assertEqual(entries[0]['action'], 'create')
+        self.assertEqual(entries[0]['model_name'], 'Студент')
+
+
+class AuditRegistryTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student = Student.objects.create(full_name="Реестр", email="reg@uni.ru")
+            self.course = Course.objects.create(name="Аудит", credits=3)
+            self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+
+    def test_enrollment_audit_without_lazy_loads(self):
+        enrollment = Enrollment.objects.get(pk=self.enrollment.pk)
+        # UPDATE записи + пересчёт сводки курса (FOR UPDATE, агрегат, UPDATE): ни student, ни course не подгружаются ради object_repr
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(4):
+            enrollment.grade = 70
+            enrollment.save()
+        [buffer] = [callback for callback in callbacks if isinstance(callback, audit.AuditBuffer)]
+        buffer()
+        entry = AuditLog.objects.filter(model_name='Запись на курс').latest('id')
+        self.assertEqual(entry.object_repr, f"Студент #{self.student.pk} → Курс #{self.course.pk}")
+
+    def test_repr_uses_loaded_relations(self):
+        enrollment = Enrollment.objects.select_related('student', 'course').get(pk=self.enrollment.pk)
+        self.assertEqual(audit.object_repr(enrollment), "Реестр (GPA: 0.00) → Аудит")
+
+    def test_unregistered_model_not_audited(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Session.objects.create(session_key='x' * 32, session_data='', expire_date=timezone.now())
+        self.assertFalse(AuditLog.objects.filter(model_name__icontains='session').exists())
+
+
+class TrackedFieldsTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student = Student.objects.create(full_name="Снимок", email="snap@uni.ru", gpa=3.0)
+
+    def test_save_writes_only_changed_fields(self):
+        student = Student.objects.get(pk=self.student.pk)
+        student.status = 'graduated'
+        with CaptureQueriesContext(connection) as queries:
+            student.save()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"status"', queries[0]['sql'])
+        self.assertNotIn('"full_name"', queries[0]['sql'])
+
+    def test_save_without_changes_is_noop(self):
+        student = Student.objects.get(pk=self.student.pk)
+        with self.assertNumQueries(0), self.captureOnCommitCallbacks() as callbacks:
+            student.save()
+        self.assertEqual(callbacks, [])
+
+    def test_audit_diff_without_extra_select(self):
+        student = Student.objects.get(pk=self.student.pk)
+        student.gpa = Decimal('3.75')
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            student.save()
+        [buffer] = [callback for callback in callbacks if isinstance(callback, audit.AuditBuffer)]
+        buffer()
+        entry = AuditLog.objects.filter(action='update').latest('id')
+        self.assertEqual(entry.changes, {'GPA': {'old': '3.00', 'new': '3.75'}})
+
+        # после сохранения снимок обновлён: повторный save ничего не пишет
+        with self.assertNumQueries(0):
+            student.save()
+
+    def test_deferred_load_clone_and_deleted_row(self):
+        # чтение отложенного поля (refresh_from_db) не должно «забыть» несохранённую правку
+        student = Student.objects.only('full_name').get(pk=self.student.pk)
+        student.full_name = "Правка"
+        student.email
+        student.save()
+        self.assertEqual(Student.objects.get(pk=self.student.pk).full_name, "Правка")
+
+        clone = Student.objects.get(pk=self.student.pk)
+        clone.pk = None
+        clone.email = "clone@uni.ru"
+        clone.save()
+        self.assertIsNotNone(clone.pk)
+        self.assertEqual(Student.objects.count(), 2)
+
+        Student.objects.filter(pk=clone.pk).delete()
+        clone.status = 'graduated'
+        clone.save()
+        self.assertEqual(Student.objects.get(pk=clone.pk).status, 'graduated')
+
+class AuditArchiveTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.override = override_settings(AUDIT_ARCHIVE_DIR=self.archive_dir)
+        self.override.enable()
+        now = timezone.now()
+        for days_ago in (400, 300, 200, 10):
+            entry = AuditLog.objects.create(action='create', model_name='Тест', object_repr=f"{days_ago} дней")
+            AuditLog.objects.filter(pk=entry.pk).update(timestamp=now - timedelta(days=days_ago))
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.archive_dir)
+
+    def test_archive_moves_old_entries_in_segments(self):
+        manifests = AuditArchive.archive(older_than_days=180, segment_size=2)
+        self.assertEqual([m['count'] for m in manifests], [2, 1])
+        self.assertEqual(list(AuditLog.objects.values_list('object_repr', flat=True)), ['10 дней'])
+        self.assertEqual(len(os.listdir(self.archive_dir)), 4)
+
+    def test_read_opens_only_covering_segments(self):
+        AuditArchive.archive(older_than_days=180, segment_size=1)
+        now = timezone.now()
+        with mock.patch('university_app.archive.gzip.open', wraps=gzip.open) as opened:
+            rows = list(AuditArchive.read(now - timedelta(days=350), now - timedelta(days=250)))
+        self.assertEqual([row['object_repr'] for row in rows], ['300 дней'])
+        self.assertEqual(opened.call_count, 1)
+
+
+class AuditLogApiTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('auditor', 'a@uni.ru', '123', role='admin')
+        self.student_user = User.objects.create_user('stud', 's@uni.ru', '123', role='student')
+        now = timezone.now()
+        # одинаковое время у части записей — курсор должен различать их по id
+        for i, minutes in enumerate([5, 5, 5, 3, 1]):
+            entry = AuditLog.objects.create(action='create', model_name='Курс' if i % 2 else 'Студент', object_id=i,
+                                            object_repr=f"#{i}")
+            AuditLog.objects.filter(pk=entry.pk).update(timestamp=now - timedelta(minutes=minutes))
+        AuditLog.objects.exclude(object_repr__startswith='#').delete()
+
+    def test_keyset_pages_cover_all_rows_once(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('auditlog-list') + '?page_size=2'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen += [row['object_repr'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, ['#4', '#3', '#2', '#1', '#0'])
+
+    def test_filters(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('auditlog-list'), {'model_name': 'Курс'})
+        self.assertEqual([row['object_repr'] for row in response.data['results']], ['#3', '#1'])
+        response = self.client.get(reverse('auditlog-list'), {'object_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_admin(self):
+        self.client.force_authenticate(self.student_user)
+        self.assertEqual(self.client.get(reverse('auditlog-list')).status_code, 403)
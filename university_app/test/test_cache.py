@@ -0,0 +1,253 @@
+import time
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from university_app.test import in_memory_cache
+from university_app.cache import UniversityCache, VersionBump, LocalLRU, CacheMetrics
+from university_app.models import User, Teacher, Student, Course, Enrollment, Payment
+
+
+@in_memory_cache
+class VersionedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher = Teacher.objects.create(full_name="Кэшев", email="cache@uni.ru")
+            self.course = Course.objects.create(name="Кэширование", credits=3, teacher=self.teacher)
+
+    def test_course_change_invalidates_courses(self):
+        self.assertEqual([c['name'] for c in UniversityCache.get_courses()], ["Кэширование"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(name="Инвалидация", credits=3)
+        self.assertEqual(len(UniversityCache.get_courses()), 2)
+
+    def test_unrelated_change_keeps_other_datasets(self):
+        courses_key = UniversityCache.get_courses_key()
+        debtors_key = UniversityCache.get_debtors_key()
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.create(full_name="Должник", email="debt@uni.ru")
+            Payment.objects.create(student=student, amount=100)
+        self.assertEqual(UniversityCache.get_courses_key(), courses_key)
+        self.assertNotEqual(UniversityCache.get_debtors_key(), debtors_key)
+
+    def test_no_bump_before_commit(self):
+        key = UniversityCache.get_courses_key()
+        with self.captureOnCommitCallbacks(execute=False):
+            Course.objects.create(name="Не закоммичен", credits=1)
+            self.assertEqual(UniversityCache.get_courses_key(), key)
+
+    def test_one_bump_per_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for i in range(3):
+                Course.objects.create(name=f"Курс {i}", credits=1)
+        self.assertEqual(len([c for c in callbacks if isinstance(c, VersionBump)]), 1)
+
+
+@in_memory_cache
+class StampedeProtectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(name="Первый", credits=3)
+
+    def test_concurrent_caller_gets_last_value_while_locked(self):
+        UniversityCache.get_courses()
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(name="Второй", credits=3)
+
+        # другой процесс уже пересобирает набор
+        cache.add(f"lock:{UniversityCache.get_courses_key()}", 1)
+        with self.assertNumQueries(0):
+            data = UniversityCache.get_courses()
+        self.assertEqual([c['name'] for c in data], ["Первый"])
+
+    def test_soft_expired_value_served_and_refreshed_in_background(self):
+        UniversityCache.get_courses()
+        key = UniversityCache.get_courses_key()
+        entry = cache.get(key)
+        entry['fresh_until'] = time.time() - 1
+        cache.set(key, entry)
+        UniversityCache.local.clear()
+
+        with mock.patch('university_app.tasks.refresh_cache_dataset.apply_async') as apply_async, \
+                self.assertNumQueries(0):
+            data = UniversityCache.get_courses()
+            UniversityCache.get_courses()
+        self.assertEqual(len(data), 1)
+        # повторный вызов не ставит вторую задачу — блокировка уже взята
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['args'], ['courses'])
+
+
+@in_memory_cache
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        CacheMetrics.reset(UniversityCache.DATASETS)
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(name="Уровни", credits=3)
+
+    def test_local_tier_serves_without_shared_payload_read(self):
+        UniversityCache.get_courses()
+        with mock.patch('university_app.cache.cache.get', wraps=cache.get) as shared_get:
+            UniversityCache.get_courses()
+        # из общего кэша читаются только версии таблиц, не сами данные
+        read_keys = [call.args[0] for call in shared_get.call_args_list]
+        self.assertTrue(read_keys)
+        self.assertTrue(all(key.startswith('table_version:') for key in read_keys))
+
+    def test_version_bump_bypasses_local_tier(self):
+        UniversityCache.get_courses()
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.create(name="Новый", credits=3)
+        self.assertEqual(len(UniversityCache.get_courses()), 2)
+
+    def test_metrics_per_family(self):
+        UniversityCache.get_courses()
+        UniversityCache.get_courses()
+        UniversityCache.local.clear()
+        UniversityCache.get_courses()
+        stats = CacheMetrics.snapshot(['courses', 'debtors'])
+        self.assertEqual(stats['courses']['misses'], 1)
+        self.assertEqual(stats['courses']['rebuilds'], 1)
+        self.assertEqual(stats['courses']['local_hits'], 1)
+        self.assertEqual(stats['courses']['shared_hits'], 1)
+        self.assertEqual(stats['debtors']['misses'], 0)
+
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+        self.assertIn('courses', out.getvalue())
+
+    def test_lru_eviction(self):
+        lru = LocalLRU(max_entries=2)
+        lru.set('a', 1, time.time() + 60)
+        lru.set('b', 2, time.time() + 60)
+        lru.get('a')
+        lru.set('c', 3, time.time() + 60)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        lru.set('d', 4, time.time() - 1)
+        self.assertIsNone(lru.get('d'))
+
+
+@in_memory_cache
+class VisibilityScopeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher = Teacher.objects.create(full_name="Область", email="scope@uni.ru")
+            self.student = Student.objects.create(full_name="Видимый", email="vis@uni.ru")
+            self.course = Course.objects.create(name="Свой", credits=3, teacher=self.teacher)
+            Enrollment.objects.create(student=self.student, course=self.course)
+
+    def test_teacher_scope_cached_until_course_change(self):
+        self.assertEqual(UniversityCache.get_teacher_scope(self.teacher.id), {'course_ids': [self.course.id]})
+        with self.assertNumQueries(0):
+            UniversityCache.get_teacher_scope(self.teacher.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Course.objects.create(name="Второй", credits=3, teacher=self.teacher)
+        self.assertEqual(UniversityCache.get_teacher_scope(self.teacher.id)['course_ids'], [self.course.id, other.id])
+
+    def test_student_scope(self):
+        self.assertEqual(UniversityCache.get_student_scope(self.student.id), {'course_ids': [self.course.id]})
+
+
+@in_memory_cache
+class CacheWarmupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher = Teacher.objects.create(full_name="Прогрев", email="warm@uni.ru")
+            self.course = Course.objects.create(name="Горячий", credits=3, teacher=self.teacher)
+
+    def test_registry_expands_per_object_datasets(self):
+        targets = UniversityCache.get_warm_targets(['teacher_schedule', 'course_stats'])
+        self.assertEqual(targets, [('teacher_schedule', (self.teacher.id,)), ('course_stats', (self.course.id,))])
+
+    def test_warm_then_refresh_ahead_skips_fresh_entries(self):
+        stats = UniversityCache.warm(workers=1)
+        self.assertEqual(stats['course_stats'], {'entries': 1, 'rebuilt': 1, 'seconds': stats['course_stats']['seconds']})
+        with self.assertNumQueries(0):
+            UniversityCache.get_course_stats(self.course.id)
+
+        stats = UniversityCache.warm(workers=1, ahead=60)
+        self.assertEqual(sum(item['rebuilt'] for item in stats.values()), 0)
+
+        # запись, которой до soft TTL меньше ahead, пересобирается заранее
+        key = UniversityCache.get_dataset_key('courses')
+        entry = cache.get(key)
+        cache.set(key, {**entry, 'fresh_until': time.time() + 30}, timeout=600)
+        stats = UniversityCache.warm(names=['courses'], workers=1, ahead=60)
+        self.assertEqual(stats['courses']['rebuilt'], 1)
+        self.assertGreater(cache.get(key)['fresh_until'], time.time() + 60)
+
+
+@in_memory_cache
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UniversityCache.local.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin = User.objects.create_user('etag-admin', 'etag@uni.ru', '123', role='admin')
+            self.student_user = User.objects.create_user('etag-student', 'etag-s@uni.ru', '123', role='student')
+            self.teacher = Teacher.objects.create(full_name="Версия", email="etag-t@uni.ru")
+            Course.objects.create(name="Первый", credits=3, teacher=self.teacher)
+        self.client.force_authenticate(user=self.admin)
+
+    def test_viewset_not_modified_until_table_changes(self):
+        url = reverse('course-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.assertNotEqual(self.client.get(url + '?page=1')['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher.full_name = "Переименован"
+            self.teacher.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['teacher_name'], "Переименован")
+
+    def test_report_etag_only_for_allowed_users(self):
+        url = reverse('debtors')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.force_authenticate(user=self.student_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_report_under_etag_never_serves_previous_version(self):
+        course = Course.objects.get()
+        url = reverse('course_average', kwargs={'course_id': course.id})
+        first = self.client.get(url)
+        self.assertEqual(first.data['total_students'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            student = Student.objects.create(full_name="Новый", email="etag-new@uni.ru")
+            Enrollment.objects.create(student=student, course=course, grade=80)
+        # другой процесс держит пересборку: значение :last (прошлой версии) под новым ETag отдавать нельзя
+        UniversityCache.local.clear()
+        cache.add(f"lock:{UniversityCache.get_dataset_key('course_stats', course.id)}", 1)
+        with mock.patch.object(UniversityCache, 'LOCK_WAIT', 0):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['total_students'], 1)
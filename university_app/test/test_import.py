@@ -0,0 +1,261 @@
+import os
+import tempfile
+import pandas as pd
+from unittest import mock
+from django.db import transaction
+from django.test import TestCase
+from openpyxl import Workbook
+from university_app.models import Student, AuditLog
+from university_app.importers import StudentImporter
+from university_app.tasks import import_students_task, import_students_sharded_task, merge_import_results
+from university.celery_app import app
+
+
+def write_csv(lines):
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+class StudentImporterTests(TestCase):
+    def setUp(self):
+        Student.objects.create(full_name="Старый", email="old@uni.ru", gpa=2.0)
+        self.path = write_csv([
+            "email,full_name,gpa,status",
+            "old@uni.ru,Обновлённый,3.456,graduated",
+            "new1@uni.ru,Новый Один,3.1,active",
+            "new2@uni.ru,Новый Два,,unknown",
+            "bad@uni.ru,Ошибка,abc,active",
+        ])
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_bulk_import_counts(self):
+        result = StudentImporter(batch_size=2).import_file(self.path)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(len(result.errors), 1)
+        self.assertIn("Строка 5", result.errors[0])
+
+        old = Student.objects.get(email="old@uni.ru")
+        self.assertEqual(old.full_name, "Обновлённый")
+        self.assertEqual(float(old.gpa), 3.46)
+        self.assertEqual(old.status, "graduated")
+        self.assertEqual(Student.objects.get(email="new2@uni.ru").status, "active")
+
+    def test_bulk_import_query_count(self):
+        # 1 SELECT существующих + INSERT + UPDATE (плюс savepoint'ы); аудит ждёт коммита
+        with self.assertNumQueries(5):
+            StudentImporter(batch_size=10).import_frame(next(StudentImporter.iter_chunks(self.path)))
+
+    def test_audit_written_in_bulk(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentImporter().import_file(self.path)
+        self.assertEqual(AuditLog.objects.filter(action='create', model_name='Студент').count(), 2)
+        self.assertEqual(AuditLog.objects.filter(action='update', model_name='Студент').count(), 1)
+
+    def test_streaming_chunks(self):
+        chunks = list(StudentImporter.iter_chunks(self.path, chunk_size=3))
+        self.assertEqual([len(c) for c in chunks], [3, 1])
+        self.assertEqual(list(chunks[1].index), [5])
+
+        result = StudentImporter(chunk_size=1).import_file(self.path)
+        self.assertEqual((result.created, result.updated, len(result.errors)), (2, 1, 1))
+        self.assertIn("Строка 5", result.errors[0])
+
+    def test_streaming_xlsx(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['email', 'full_name', 'gpa', 'status'])
+        sheet.append(['x1@uni.ru', 'Иксель Один', 3.9, 'active'])
+        sheet.append([None, None, None, None])
+        sheet.append(['x2@uni.ru', 'Иксель Два', None, 'expelled'])
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        workbook.save(path)
+        try:
+            result = StudentImporter(chunk_size=1).import_file(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(Student.objects.get(email='x2@uni.ru').status, 'expelled')
+
+    def test_unchanged_rows_are_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentImporter().import_file(self.path)
+        audit_before = AuditLog.objects.count()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = StudentImporter().import_file(self.path)
+        self.assertEqual((result.created, result.updated, result.unchanged), (0, 0, 3))
+        self.assertEqual(AuditLog.objects.count(), audit_before)
+        self.assertIn("Без изменений: 3", result.summary())
+
+    def test_update_audit_has_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentImporter().import_file(self.path)
+        entry = AuditLog.objects.get(action='update', model_name='Студент')
+        self.assertEqual(entry.changes['Статус'], {'old': 'active', 'new': 'graduated'})
+        self.assertEqual(entry.changes['GPA'], {'old': '2.00', 'new': '3.46'})
+
+    def test_vectorized_validation(self):
+        df = pd.DataFrame({
+            'email': [' A@Uni.ru ', 'a@uni.ru', None, 'broken', 'b@uni.ru'],
+            'full_name': ['А', 'А2', 'Без почты', 'Битый', ''],
+            'gpa': [3.333, 5, 1, None, 'x'],
+            'status': ['Отчислен', 'graduated', 'active', 'weird', None],
+        }, index=[2, 3, 4, 5, 6])
+        clean, errors = StudentImporter.validate_frame(df)
+
+        self.assertEqual(list(clean.index), [2])
+        self.assertEqual(clean.loc[2].to_dict(), {
+            'email': 'A@Uni.ru', 'email_key': 'a@uni.ru', 'full_name': 'А', 'gpa': 3.33, 'status': 'expelled',
+        })
+        self.assertEqual(
+            list(errors.itertuples(index=False, name=None)),
+            [
+                (3, 'email', 'повтор, впервые в строке 2'),
+                (3, 'gpa', 'GPA должен быть от 0 до 4.0'),
+                (4, 'email', 'обязательное поле'),
+                (5, 'email', 'некорректный email'),
+                (6, 'full_name', 'обязательное поле'),
+                (6, 'gpa', 'не число'),
+            ]
+        )
+
+    def test_bad_row_does_not_reject_batch(self):
+        path = write_csv(["email,full_name,gpa", "ok1@uni.ru,Первый,1", "long@uni.ru," + "Я" * 301 + ",2", "ok2@uni.ru,Второй,3"])
+        try:
+            result = StudentImporter(batch_size=10).import_file(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.errors, ["Строка 3: full_name: длиннее 300 символов"])
+
+        # ошибка БД в пачке (здесь — имитация на первой попытке) отклоняет только свою строку
+        rows = [(2, {'email': 'r1@uni.ru', 'email_key': 'r1@uni.ru', 'full_name': 'Р1', 'gpa': 1.0, 'status': 'active'}),
+                (3, {'email': 'r2@uni.ru', 'email_key': 'r2@uni.ru', 'full_name': 'Р2', 'gpa': 2.0, 'status': 'active'})]
+        importer = StudentImporter()
+        original = Student.objects.bulk_create
+
+        def failing(objs, *args, **kwargs):
+            objs = list(objs)
+            if any(obj.email == 'r2@uni.ru' for obj in objs):
+                raise ValueError("сбой")
+            return original(objs, *args, **kwargs)
+
+        with mock.patch.object(Student.objects, 'bulk_create', side_effect=failing):
+            importer.write_batch(rows)
+        self.assertEqual(importer.result.created, 1)
+        self.assertEqual(importer.result.errors, ["Строка 3: сбой"])
+        self.assertTrue(Student.objects.filter(email='r1@uni.ru').exists())
+
+    def test_email_matched_case_insensitively(self):
+        Student.objects.create(full_name="Иван", email="Ivan.Petrov@Uni.ru", gpa=2.0)
+        path = write_csv(["email,full_name,gpa", "ivan.petrov@uni.ru,Иван Петров,3", "New.One@Uni.ru,Новый,1"])
+        try:
+            result = StudentImporter().import_file(path)
+        finally:
+            os.remove(path)
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(Student.objects.get(email="Ivan.Petrov@Uni.ru").full_name, "Иван Петров")
+        self.assertFalse(Student.objects.filter(email="ivan.petrov@uni.ru").exists())
+        self.assertTrue(Student.objects.filter(email="New.One@Uni.ru").exists())
+
+    def test_duplicates_across_chunks(self):
+        path = write_csv(["email,full_name,gpa", "z@uni.ru,Первый,1", "Z@uni.ru,Второй,2"])
+        try:
+            result = StudentImporter(chunk_size=1).import_file(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.errors, ["Строка 3: email: повтор, впервые в строке 2"])
+        self.assertEqual(Student.objects.get(email='z@uni.ru').full_name, 'Первый')
+
+    def test_duplicate_rule_does_not_depend_on_chunk_size(self):
+        path = write_csv(["email,full_name,gpa", "A@x.ru,Плохой,abc", "a@x.ru,Хороший,3", "b@x.ru,Б,1", "B@x.ru,Б повтор,2"])
+        try:
+            results = []
+            for chunk_size in (None, 1):
+                with transaction.atomic():
+                    result = StudentImporter(chunk_size=chunk_size).import_file(path)
+                    results.append((result.created, result.errors))
+                    transaction.set_rollback(True)
+        finally:
+            os.remove(path)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[0], (1, [
+            "Строка 2: gpa: не число",
+            "Строка 3: email: повтор, впервые в строке 2",
+            "Строка 5: email: повтор, впервые в строке 4",
+        ]))
+
+    def test_task_report(self):
+        report = import_students_task(self.path)
+        self.assertIn("Создано: 2", report)
+        self.assertIn("Обновлено: 1", report)
+
+
+class ShardedImportTests(TestCase):
+    def setUp(self):
+        self.path = write_csv([
+            "email,full_name,gpa,status",
+            "a@uni.ru,А,3.0,active",
+            "b@uni.ru,Б,3.1,active",
+            "c@uni.ru,В,3.2,active",
+            "a@uni.ru,А повтор,3.3,active",
+            "d@uni.ru,Г,3.4,active",
+        ])
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_plan_assigns_duplicates_to_first_row(self):
+        plan = StudentImporter.plan_shards(self.path, 2)
+        self.assertEqual([(p['start_row'], p['end_row']) for p in plan], [(2, 5), (5, 7)])
+        self.assertEqual(plan[1]['skip_rows'], [[5, 2]])
+
+    def test_blank_lines_keep_shards_disjoint(self):
+        path = write_csv(["email,full_name,gpa", "s1@x.ru,А,1", "", "s2@x.ru,Б,2", "s3@x.ru,В,3", "", "s4@x.ru,Г,4", "s5@x.ru,Д,abc"])
+        try:
+            plan = StudentImporter.plan_shards(path, 2)
+            shards = [
+                list(pd.concat(StudentImporter.iter_chunks(path, start_row=p['start_row'], end_row=p['end_row']))['email'])
+                for p in plan
+            ]
+            result = StudentImporter().import_file(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(shards, [['s1@x.ru', 's2@x.ru', 's3@x.ru'], ['s4@x.ru', 's5@x.ru']])
+        # номер строки в ошибке — физическая строка файла, с учётом пустых
+        self.assertEqual(result.created, 4)
+        self.assertIn("Строка 8", result.errors[0])
+
+    def test_blank_emails_are_not_duplicates_in_plan(self):
+        path = write_csv(["email,full_name,gpa", "s1@x.ru,А,1", ",Б,2", "s2@x.ru,В,3", ",Г,4"])
+        try:
+            plan = StudentImporter.plan_shards(path, 2)
+        finally:
+            os.remove(path)
+        self.assertEqual([p['skip_rows'] for p in plan], [[], []])
+
+    def test_sharded_import_merges_report(self):
+        app.conf.task_always_eager = True
+        try:
+            import_students_sharded_task.delay(self.path, shards=2).get()
+        finally:
+            app.conf.task_always_eager = False
+        self.assertEqual(Student.objects.count(), 4)
+        self.assertEqual(Student.objects.get(email='a@uni.ru').full_name, 'А')
+
+    def test_merge_report_has_shard_timings(self):
+        report = merge_import_results([
+            {'shard': 2, 'start_row': 5, 'end_row': 7, 'created': 1, 'updated': 0, 'errors': ['Строка 5: дубль'], 'seconds': 0.2},
+            {'shard': 1, 'start_row': 2, 'end_row': 5, 'created': 3, 'updated': 0, 'errors': [], 'seconds': 0.1},
+        ])
+        self.assertIn("Создано: 4", report)
+        self.assertIn("Ошибок: 1", report)
+        self.assertIn("#1 строки 2–4", report)
+        self.assertIn("0.2 с", report)
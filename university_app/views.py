@@ -1,60 +1,38 @@
-from rest_framework import viewsets, permissions
-from rest_framework.decorators import api_view, permission_classes
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework import mixins, viewsets, permissions, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from .models import (
     Department, Teacher, Student, Course,
-    Enrollment, Schedule, Exam, Payment
+    Enrollment, Schedule, Exam, Payment, AuditLog, ReportJob
 )
 from .serializers import (
     DepartmentSerializer, TeacherSerializer, StudentSerializer, CourseSerializer,
-    EnrollmentSerializer, ScheduleSerializer, ExamSerializer, PaymentSerializer
+    EnrollmentSerializer, ScheduleSerializer, ExamSerializer, PaymentSerializer,
+    AuditLogSerializer, ReportJobSerializer
 )
+from .bulk import EnrollmentBulk
+from .cache import UniversityCache
+from .conditional import ConditionalGetMixin, etag_report
+from .fastlist import FastListMixin
+from .sparse import SparseFieldsMixin
+from .jobs import REPORTS, ReportJobs
+from .pagination import KeysetPagination
+from .scoping import scope_queryset
+from .permissions import IsAdminRole
 from .reports import UniversityReports
 
 
-class BaseViewSet(viewsets.ModelViewSet):
+class BaseViewSet(SparseFieldsMixin, ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        user = self.request.user
-        role = user.role
-
-        if role == 'admin':
-            return self.queryset.all()
-
-        if role == 'teacher':
-            teacher_profile = user.teacher_profile
-            if not teacher_profile:
-                return self.queryset.none()
-
-            if self.queryset.model == Course:
-                return Course.objects.filter(teacher=teacher_profile)
-            if self.queryset.model == Enrollment:
-                return Enrollment.objects.filter(course__teacher=teacher_profile)
-            if self.queryset.model == Schedule:
-                return Schedule.objects.filter(teacher=teacher_profile)
-            if self.queryset.model == Student:
-                return Student.objects.filter(enrollments__course__teacher=teacher_profile).distinct()
-
-        if role == 'student':
-            student_profile = user.student_profile
-            if not student_profile:
-                return self.queryset.none()
-
-            if self.queryset.model == Enrollment:
-                return Enrollment.objects.filter(student=student_profile)
-            if self.queryset.model == Course:
-                return Course.objects.filter(enrollments__student=student_profile).distinct()
-            if self.queryset.model == Payment:
-                return Payment.objects.filter(student=student_profile)
-            if self.queryset.model == Exam:
-                return Exam.objects.filter(course__enrollments__student=student_profile).distinct()
-            if self.queryset.model == Schedule:
-                return Schedule.objects.filter(course__enrollments__student=student_profile).distinct()
-
-        return self.queryset.none()
+        # фильтр роли ложится поверх self.queryset: select_related вьюсета сохраняются (см. scoping.py)
+        return scope_queryset(self.queryset, self.request.user)
 
 
 # === Все ViewSet'ы ===
@@ -66,6 +44,7 @@ class DepartmentViewSet(BaseViewSet):
 class TeacherViewSet(BaseViewSet):
     queryset = Teacher.objects.select_related('department').all()
     serializer_class = TeacherSerializer
+    etag_models = (Teacher, Department)
 
 
 class StudentViewSet(BaseViewSet):
@@ -76,21 +55,38 @@ class StudentViewSet(BaseViewSet):
 class CourseViewSet(BaseViewSet):
     queryset = Course.objects.select_related('teacher').all()
     serializer_class = CourseSerializer
+    etag_models = (Course, Teacher)
 
 
 class EnrollmentViewSet(BaseViewSet):
     queryset = Enrollment.objects.select_related('student', 'course__teacher').all()
     serializer_class = EnrollmentSerializer
+    etag_models = (Enrollment, Student, Course)
+
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        """
+        POST  [{"student": 1, "course": 2, "grade": 75}, ...] — массовая запись на курсы;
+        PATCH [{"id": 10, "grade": 85}, ...] — массовое выставление оценок.
+        Всё или ничего: при ошибке в любой строке — 400 с ошибками по индексам строк.
+        """
+        if request.method == 'POST':
+            enrollments = EnrollmentBulk.create(request.data, request.user)
+            return Response({'created': len(enrollments), 'ids': [e.pk for e in enrollments]}, status=status.HTTP_201_CREATED)
+        updated = EnrollmentBulk.update_grades(request.data, request.user, self.get_queryset())
+        return Response({'updated': len(updated), 'ids': [e.pk for e in updated]})
 
 
 class ScheduleViewSet(BaseViewSet):
     queryset = Schedule.objects.select_related('course__teacher', 'teacher').all()
     serializer_class = ScheduleSerializer
+    etag_models = (Schedule, Course, Teacher)
 
 
 class ExamViewSet(BaseViewSet):
     queryset = Exam.objects.select_related('course__teacher').all()
     serializer_class = ExamSerializer
+    etag_models = (Exam, Course)
 
 
 class PaymentViewSet(BaseViewSet):
@@ -98,38 +94,160 @@ class PaymentViewSet(BaseViewSet):
     serializer_class = PaymentSerializer
 
 
+# === ЖУРНАЛ АУДИТА ===
+class AuditLogViewSet(SparseFieldsMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Журнал аудита (только admin).
+    Фильтры: model_name, object_id, user, since, until (ISO 8601).
+    Keyset-пагинация по (timestamp, id) — опирается на индексы AuditLog, без COUNT(*) и OFFSET.
+    """
+    queryset = AuditLog.objects.select_related('user').all()
+    serializer_class = AuditLogSerializer
+    permission_classes = [IsAuthenticated, IsAdminRole]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-timestamp', '-id')
+
+    def get_queryset(self):
+        queryset = self.queryset
+        params = self.request.query_params
+
+        if params.get('model_name'):
+            queryset = queryset.filter(model_name=params['model_name'])
+        for param in ('object_id', 'user'):
+            if params.get(param):
+                if not params[param].isdigit():
+                    raise ValidationError({param: 'Ожидается целое число'})
+                queryset = queryset.filter(**{param: int(params[param])})
+        for param, lookup in (('since', 'timestamp__gte'), ('until', 'timestamp__lt')):
+            if params.get(param):
+                try:
+                    value = parse_datetime(params[param])
+                except ValueError:
+                    value = None
+                if value is None:
+                    raise ValidationError({param: 'Ожидается дата-время в формате ISO 8601'})
+                queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+
+# === ФОНОВЫЕ ОТЧЁТЫ ===
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    POST {"report": "debtors", "params": {...}} → задача (201 — новая, 200 — такая же уже есть);
+    GET /<id>/ — статус, GET /<id>/result/ — JSON результата, пока не истёк TTL.
+    """
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def check_report_access(self, report, params):
+        if report not in REPORTS:
+            raise ValidationError({'report': f"Неизвестный отчёт. Доступны: {', '.join(REPORTS)}"})
+        user = self.request.user
+        if user.role not in REPORTS[report].roles:
+            raise PermissionDenied("Доступ запрещён")
+        if report == 'teacher_schedule' and user.role == 'teacher' \
+                and params.get('teacher_id') is not None and str(params['teacher_id']) != str(user.teacher_profile_id):
+            raise PermissionDenied("Можно просматривать только своё расписание")
+
+    def create(self, request, *args, **kwargs):
+        report = request.data.get('report')
+        params = request.data.get('params') or {}
+        if not isinstance(params, dict):
+            raise ValidationError({'params': 'Ожидается объект'})
+        self.check_report_access(report, params)
+        job, created = ReportJobs.submit(report, params, user=request.user)
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    def get_object(self):
+        # задача общая для всех заказавших одинаковый отчёт: доступ — по роли и параметрам, а не по владельцу
+        job = super().get_object()
+        self.check_report_access(job.report, job.params)
+        return job
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        job = self.get_object()
+        path = ReportJobs.get_result_path(job)
+        if path is None:
+            raise NotFound("Результат не готов или истёк")
+        return FileResponse(open(path, 'rb'), content_type='application/json')
+
+
 # === ОТЧЁТЫ ===
+def wants_ndjson(request):
+    return request.query_params.get('output') == 'ndjson'
+
+
+def ndjson_response(queryset):
+    """?output=ndjson: по строке JSON на запись, первые байты уходят до того, как отчёт досчитан"""
+    return StreamingHttpResponse(UniversityReports.stream_ndjson(queryset), content_type='application/x-ndjson')
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@etag_report(Student, Enrollment)
 def report_students_above_average(request):
     if request.user.role not in ['admin', 'teacher']:
         return Response({"error": "Доступ запрещён"}, status=403)
+    if wants_ndjson(request):
+        return ndjson_response(UniversityReports.students_above_course_average_queryset())
     data = UniversityReports.students_above_course_average()
     return Response({"results": data})
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@etag_report(Schedule, Course)
 def report_teacher_schedule(request, teacher_id):
     if request.user.role == 'teacher' and getattr(request.user.teacher_profile, 'id', None) != teacher_id:
         return Response({"error": "Можно просматривать только своё расписание"}, status=403)
     if request.user.role not in ['admin', 'teacher']:
         return Response({"error": "Доступ запрещён"}, status=403)
-    data = UniversityReports.teacher_week_schedule(teacher_id)
+    if wants_ndjson(request):
+        return ndjson_response(UniversityReports.teacher_week_schedule_queryset(teacher_id))
+    data = UniversityCache.get_teacher_schedule(teacher_id, strict=True)
     return Response({"schedule": data})
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@etag_report(Enrollment)
 def report_course_average(request, course_id):
     if request.user.role not in ['admin', 'teacher']:
         return Response({"error": "Доступ запрещён"}, status=403)
-    data = UniversityReports.course_average_grade(course_id)
+    data = UniversityCache.get_course_stats(course_id, strict=True)
     return Response(data)
 
 
+def parse_id_list(value, param):
+    """'1,2,3' → [1, 2, 3]; иначе 400"""
+    ids = [part.strip() for part in value.split(',') if part.strip()]
+    if not all(part.isdigit() for part in ids):
+        raise ValidationError({param: 'Ожидается список целых чисел через запятую'})
+    return [int(part) for part in ids]
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@etag_report(Course, Enrollment)
+def report_course_statistics(request):
+    """Пакетная статистика курсов: ?course_ids=1,2,3 и/или ?teacher_id=5, без параметров — все курсы"""
+    if request.user.role not in ['admin', 'teacher']:
+        return Response({"error": "Доступ запрещён"}, status=403)
+    params = request.query_params
+    course_ids = parse_id_list(params['course_ids'], 'course_ids') if params.get('course_ids') else None
+    teacher_id = params.get('teacher_id')
+    if teacher_id and not teacher_id.isdigit():
+        raise ValidationError({'teacher_id': 'Ожидается целое число'})
+    data = UniversityReports.course_statistics(course_ids=course_ids, teacher_id=int(teacher_id) if teacher_id else None)
+    return Response({"results": data})
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@etag_report(Student)
 def report_top_5_students(request):
     if request.user.role != 'admin':
         return Response({"error": "Доступ запрещён"}, status=403)
@@ -139,8 +257,11 @@ def report_top_5_students(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@etag_report(Student, Payment)
 def report_debtors(request):
     if request.user.role != 'admin':
         return Response({"error": "Доступ запрещён"}, status=403)
+    if wants_ndjson(request):
+        return ndjson_response(UniversityReports.debtors_with_debt_amount_queryset())
     data = UniversityReports.debtors_with_debt_amount()
     return Response({"debtors": data})